@@ -0,0 +1,141 @@
+#!/usr/bin/python3
+
+import json
+import multiprocessing
+import os
+import time
+
+from display import Display
+from headless import HeadlessRunner, read_input_script
+from interpreter import load_sprites
+from numpy_display import display_class
+
+
+class Job:
+
+    def __init__(self, game_file, cycles, input_script=None, events=()):
+        self.game_file = game_file
+        self.cycles = cycles
+        self.input_script = input_script
+        self.events = list(events)
+
+
+class JobResult:
+
+    def __init__(self, job, run_result, worker):
+        self.game_file = job.game_file
+        self.input_script = job.input_script
+        self.cycles = run_result.instructions
+        self.seconds = run_result.seconds
+        self.state_hash = run_result.state_hash
+        self.worker = worker
+
+    @property
+    def instructions_per_second(self):
+        if self.seconds == 0:
+            return 0
+        return self.cycles / self.seconds
+
+    def to_dict(self):
+        return {'rom': self.game_file,
+                'input': self.input_script,
+                'cycles': self.cycles,
+                'seconds': self.seconds,
+                'instructions_per_second': self.instructions_per_second,
+                'state_hash': self.state_hash,
+                'worker': self.worker}
+
+
+class BatchReport:
+
+    def __init__(self, results, seconds, processes):
+        self.results = results
+        self.seconds = seconds
+        self.processes = processes
+
+    @property
+    def cycles(self):
+        return sum(result.cycles for result in self.results)
+
+    @property
+    def instructions_per_second(self):
+        if self.seconds == 0:
+            return 0
+        return self.cycles / self.seconds
+
+    def to_dict(self):
+        return {'jobs': [result.to_dict() for result in self.results],
+                'processes': self.processes,
+                'cycles': self.cycles,
+                'seconds': self.seconds,
+                'instructions_per_second': self.instructions_per_second}
+
+
+_worker_runner = None
+_worker_settings = None
+
+
+def _initialize_worker(sprites, cycles_per_frame, use_translator, seed,
+                       display=Display):
+    global _worker_runner, _worker_settings
+    _worker_runner = None
+    _worker_settings = (sprites, cycles_per_frame, use_translator, seed,
+                        display)
+
+
+def _run_job(job):
+    global _worker_runner
+    if _worker_runner is None:
+        _worker_runner = HeadlessRunner(job.game_file, *_worker_settings)
+    else:
+        _worker_runner.reset(job.game_file)
+    result = _worker_runner.run(job.cycles, job.events)
+    return JobResult(job, result, os.getpid())
+
+
+def run_batch(jobs, sprites, processes=None, cycles_per_frame=10,
+              use_translator=False, seed=None, display=Display):
+    processes = processes or os.cpu_count() or 1
+    processes = min(processes, max(len(jobs), 1))
+    start = time.perf_counter()
+    with multiprocessing.Pool(processes, _initialize_worker,
+                              (sprites, cycles_per_frame,
+                               use_translator, seed, display)) as pool:
+        results = pool.map(_run_job, jobs, chunksize=1)
+    return BatchReport(results, time.perf_counter() - start, processes)
+
+
+def create_jobs(paths, input_scripts, cycles):
+    game_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            game_files.extend(os.path.join(path, name)
+                              for name in sorted(os.listdir(path)))
+        else:
+            game_files.append(path)
+    scripts = [(script, read_input_script(script))
+               for script in input_scripts] or [(None, [])]
+    return [Job(game_file, cycles, script, events)
+            for game_file in game_files
+            for script, events in scripts]
+
+
+def run(args):
+    sprites = load_sprites(args.sprites)
+    jobs = create_jobs(args.roms, args.input, args.cycles)
+    report = run_batch(jobs, sprites, args.processes, args.cycles_per_frame,
+                       args.translate, args.seed,
+                       display_class(args.display))
+    if args.json:
+        print(json.dumps(report.to_dict(), indent=2))
+        return 0
+    for result in report.results:
+        print("{0} {1} {2} {3:.0f}/s {4}".format(
+            result.game_file, result.input_script or '-', result.cycles,
+            result.instructions_per_second, result.state_hash))
+    print("jobs:", len(report.results))
+    print("processes:", report.processes)
+    print("instructions:", report.cycles)
+    print("seconds: {0:.3f}".format(report.seconds))
+    print("instructions/sec: {0:.0f}".format(report.instructions_per_second))
+    return 0
@@ -0,0 +1,277 @@
+#!/usr/bin/python3
+
+import argparse
+import hashlib
+import json
+import os
+import statistics
+import sys
+import timeit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from commands import Command  # noqa: E402
+from headless import DEFAULT_SPRITES, HeadlessRunner, \
+    read_input_script  # noqa: E402
+from interpreter import Interpreter, load_sprites  # noqa: E402
+
+GAMES = os.path.join(ROOT, "games")
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+BASELINE = os.path.join(BENCHMARKS, "baseline.json")
+INPUT = os.path.join(BENCHMARKS, "input.txt")
+
+ROM_CYCLES = 100000
+CYCLES_PER_FRAME = 10
+REPEAT = 7
+TOLERANCE = 0.25
+MAX_NOISE = 0.3
+TRANSLATED = "/translated"
+
+
+class Result:
+
+    def __init__(self, name, value, unit, params=None, spread=0,
+                 measure=None):
+        self.name = name
+        self.value = value
+        self.unit = unit
+        self.params = params
+        self.spread = spread
+        self.measure = measure
+
+    def remeasure(self):
+        if self.measure is not None:
+            self.value, self.spread = self.measure()
+
+    @property
+    def higher_is_better(self):
+        return self.unit == "instructions/sec"
+
+    def comparable(self, entry):
+        return entry.get("params") == self.params
+
+    def regression(self, baseline, tolerance):
+        tolerance = max(tolerance, min(self.spread, MAX_NOISE))
+        if self.higher_is_better:
+            return self.value < baseline * (1 - tolerance)
+        return self.value > baseline * (1 + tolerance)
+
+    def change(self, baseline):
+        if baseline == 0:
+            return 0
+        return self.value / baseline - 1
+
+
+def spread(samples, value):
+    if value == 0:
+        return 0
+    return statistics.median([abs(sample - value)
+                              for sample in samples]) / value
+
+
+def run_parameters(cycles, cycles_per_frame, input_path=INPUT):
+    with open(input_path, 'rb') as f:
+        input_hash = hashlib.sha1(f.read()).hexdigest()
+    return {"cycles": cycles, "cycles_per_frame": cycles_per_frame,
+            "input": input_hash}
+
+
+def run_rom(game_file, sprites, events, cycles, use_translator,
+            cycles_per_frame=CYCLES_PER_FRAME):
+    runner = HeadlessRunner(game_file, sprites, cycles_per_frame,
+                            use_translator, seed=0)
+    runner.run(cycles, events)
+    speeds = []
+    for _ in range(REPEAT):
+        runner.reset(game_file)
+        speeds.append(runner.run(cycles, events).instructions_per_second)
+    speed = statistics.median(speeds)
+    return speed, spread(speeds, speed)
+
+
+def rom_benchmarks(sprites, cycles=ROM_CYCLES, games=None,
+                   cycles_per_frame=CYCLES_PER_FRAME):
+    events = read_input_script(INPUT)
+    params = run_parameters(cycles, cycles_per_frame)
+    results = []
+    for game in games or sorted(os.listdir(GAMES)):
+        game_file = os.path.join(GAMES, game)
+        for suffix, use_translator in (("", False), (TRANSLATED, True)):
+            def measure(game_file=game_file, use_translator=use_translator):
+                return run_rom(game_file, sprites, events, cycles,
+                               use_translator, cycles_per_frame)
+            speed, noise = measure()
+            results.append(Result("rom/" + game + suffix, speed,
+                                  "instructions/sec", params, noise,
+                                  measure))
+    return results
+
+
+def time_operation(function, number):
+    samples = [1e6 * seconds / number
+               for seconds in timeit.repeat(function, number=number,
+                                            repeat=REPEAT + 2)]
+    return min(samples), spread(samples, statistics.median(samples))
+
+
+def micro_result(name, function, number, operations=1):
+    def measure():
+        value, noise = time_operation(function, number)
+        return value / operations, noise
+    value, noise = measure()
+    return Result(name, value, "us/op", {}, noise, measure)
+
+
+def micro_benchmarks(sprites):
+    interpreter = Interpreter(os.path.join(GAMES, "UFO"), None, sprites,
+                              seed=0)
+    codes = [0x00e0, 0x1234, 0x3a12, 0x6b34, 0x8124, 0xa123, 0xc0ff,
+             0xd125, 0xe19e, 0xf133]
+    draw = Command.Draw(interpreter)
+    memory = interpreter.memory
+    state = interpreter.serialize_state()
+
+    def decode():
+        for code in codes:
+            interpreter.decode(code)
+
+    def access_memory():
+        for address in range(0, 4096, 64):
+            memory.store_value(address, memory.get_value(address) + 1)
+
+    return [micro_result("micro/decode", decode, 2000, len(codes)),
+            micro_result("micro/draw",
+                         lambda: draw.execute_command(30, 13, 15), 20000),
+            micro_result("micro/memory", access_memory, 2000, 64),
+            micro_result("micro/serialize_state",
+                         interpreter.serialize_state, 5000),
+            micro_result("micro/load_state",
+                         lambda: interpreter.load_state(state), 5000)]
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, baseline, results):
+    baseline = dict(baseline)
+    baseline.update((result.name, {"value": result.value,
+                                   "unit": result.unit,
+                                   "params": result.params,
+                                   "spread": result.spread})
+                    for result in results)
+    with open(path, "w") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    return [result for result in results
+            if result.name in baseline and
+            result.comparable(baseline[result.name]) and
+            result.regression(baseline[result.name]["value"], tolerance)]
+
+
+def confirm(regressions, baseline, tolerance=TOLERANCE):
+    for result in regressions:
+        result.remeasure()
+    return compare(regressions, baseline, tolerance)
+
+
+def plain_baseline(results):
+    return {result.name + TRANSLATED: {"value": result.value,
+                                       "params": result.params}
+            for result in results
+            if result.name.startswith("rom/") and
+            not result.name.endswith(TRANSLATED)}
+
+
+def slower_than_plain(results, tolerance=TOLERANCE):
+    return compare(results, plain_baseline(results), tolerance)
+
+
+def confirm_slower_than_plain(slower, results, tolerance=TOLERANCE):
+    names = [result.name[:-len(TRANSLATED)] for result in slower]
+    plain = [result for result in results if result.name in names]
+    for result in slower + plain:
+        result.remeasure()
+    return slower_than_plain(slower + plain, tolerance)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the emulator core against a stored baseline")
+    parser.add_argument("games", nargs="*",
+                        help="ROMs from games/ to run, defaults to all")
+    parser.add_argument("--cycles", type=int, default=ROM_CYCLES,
+                        help="instructions executed per ROM")
+    parser.add_argument("--cycles-per-frame", type=int,
+                        default=CYCLES_PER_FRAME,
+                        help="instructions executed per 60 Hz frame")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="allowed slowdown as a fraction of the "
+                             "baseline, raised to the measured noise up "
+                             "to {0:.0f}%%".format(100 * MAX_NOISE))
+    parser.add_argument("--baseline", default=BASELINE,
+                        help="baseline file to compare against")
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--skip-roms", action="store_true",
+                        help="run only the microbenchmarks")
+    parser.add_argument("--sprites", default=DEFAULT_SPRITES,
+                        help="path to the 80-byte font")
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    sprites = load_sprites(args.sprites)
+    results = micro_benchmarks(sprites)
+    if not args.skip_roms:
+        results += rom_benchmarks(sprites, args.cycles, args.games,
+                                  args.cycles_per_frame)
+    baseline = load_baseline(args.baseline)
+    regressions = confirm(compare(results, baseline, args.tolerance),
+                          baseline, args.tolerance)
+    slower = confirm_slower_than_plain(
+        slower_than_plain(results, args.tolerance), results, args.tolerance)
+    plain = plain_baseline(results)
+    for result in results:
+        line = "{0:<32}{1:>14.2f} {2}  noise {3:.1%}".format(
+            result.name, result.value, result.unit, result.spread)
+        if result.name in baseline:
+            if result.comparable(baseline[result.name]):
+                line += "  {0:+.1%}".format(
+                    result.change(baseline[result.name]["value"]))
+            else:
+                line += "  not compared, the baseline used other " \
+                    "parameters"
+        if result.name in plain:
+            line += "  {0:.2f}x plain".format(
+                result.value / plain[result.name]["value"])
+        if result in regressions:
+            line += "  REGRESSION"
+        if result in slower:
+            line += "  SLOWER THAN PLAIN"
+        print(line)
+    if args.update_baseline:
+        save_baseline(args.baseline, baseline, results)
+        print("baseline written to", args.baseline)
+        return 0
+    if slower:
+        print(len(slower), "translated ROMs are more than",
+              "{0:.0%}".format(args.tolerance), "slower than the interpreter")
+    if regressions:
+        print(len(regressions), "benchmarks are more than",
+              "{0:.0%}".format(args.tolerance), "slower than the baseline")
+    if slower or regressions:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+
+import hashlib
+import json
+import os
+
+import opcodes
+
+VERSION = 1
+GAMES = "games"
+CATALOG = "catalog.json"
+
+PROGRAM_START = 0x200
+DEFAULT_SPEED = 85
+UNTIMED_SPEED = 80
+
+SKIPS = {opcodes.pass_if_equal, opcodes.pass_if_not_equal,
+         opcodes.pass_if_registers_equal,
+         opcodes.pass_if_registers_not_equal,
+         opcodes.check_pushed, opcodes.check_not_pushed}
+STOPS = {opcodes.return_, opcodes.jump_with_offset}
+
+QUIRKS = {opcodes.shift_right: "shift", opcodes.shift_left: "shift",
+          opcodes.or_: "logic", opcodes.and_: "logic", opcodes.xor: "logic",
+          opcodes.store_registers: "load_store",
+          opcodes.load_registers: "load_store",
+          opcodes.jump_with_offset: "jump_with_offset"}
+
+
+def analyze(data):
+    end = PROGRAM_START + len(data)
+    handlers = {}
+    code = set()
+    entry_points = {PROGRAM_START}
+    invalid = set()
+    pending = [PROGRAM_START]
+    while pending:
+        address = pending.pop()
+        if address in code or address in invalid or \
+                not PROGRAM_START <= address < end - 1:
+            continue
+        offset = address - PROGRAM_START
+        try:
+            handler, x, y, value = opcodes.predecode(
+                data[offset] << 8 | data[offset + 1])
+        except Exception:
+            invalid.add(address)
+            continue
+        code.add(address)
+        handlers[handler] = handlers.get(handler, 0) + 1
+        if handler is opcodes.jump:
+            pending.append(value)
+        elif handler is opcodes.call:
+            entry_points.add(value)
+            pending += [value, address + 2]
+        elif handler in SKIPS:
+            pending += [address + 2, address + 4]
+        elif handler not in STOPS:
+            pending.append(address + 2)
+    return handlers, sorted(entry_points), sorted(invalid), len(code)
+
+
+def suggest_settings(handlers):
+    speed = DEFAULT_SPEED
+    if opcodes.set_delay_timer not in handlers:
+        speed = UNTIMED_SPEED
+    quirks = sorted({QUIRKS[handler] for handler in handlers
+                     if handler in QUIRKS})
+    return {"speed": speed, "quirks": quirks}
+
+
+class RomInfo:
+
+    def __init__(self, name, size, mtime, sha1, entry_points, summary,
+                 settings):
+        self.name = name
+        self.size = size
+        self.mtime = mtime
+        self.sha1 = sha1
+        self.entry_points = entry_points
+        self.summary = summary
+        self.settings = settings
+
+    @staticmethod
+    def scan(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        stat = os.stat(path)
+        handlers, entry_points, invalid, instructions = analyze(data)
+        summary = {"instructions": instructions,
+                   "data_bytes": max(0, len(data) - 2 * instructions),
+                   "invalid": invalid,
+                   "opcodes": {handler.__name__: count
+                               for handler, count
+                               in sorted(handlers.items(),
+                                         key=lambda item: -item[1])}}
+        return RomInfo(os.path.basename(path), stat.st_size,
+                       stat.st_mtime_ns, hashlib.sha1(data).hexdigest(),
+                       entry_points, summary, suggest_settings(handlers))
+
+    def is_current(self, stat):
+        return self.size == stat.st_size and self.mtime == stat.st_mtime_ns
+
+    def to_dict(self):
+        return {"size": self.size, "mtime": self.mtime, "sha1": self.sha1,
+                "entry_points": self.entry_points, "summary": self.summary,
+                "settings": self.settings}
+
+    @staticmethod
+    def from_dict(name, entry):
+        return RomInfo(name, entry["size"], entry["mtime"], entry["sha1"],
+                       entry["entry_points"], entry["summary"],
+                       entry["settings"])
+
+    def describe(self):
+        return "{0}  {1} bytes  {2} instructions  entry points: {3}  " \
+            "quirks: {4}".format(self.sha1[:12], self.size,
+                                 self.summary["instructions"],
+                                 " ".join("0x{0:03x}".format(address)
+                                          for address in self.entry_points),
+                                 ", ".join(self.settings["quirks"]) or
+                                 "none")
+
+
+class Catalog:
+
+    def __init__(self, games=GAMES, path=CATALOG):
+        self.games = games
+        self.path = path
+        self.entries = {}
+        self.scanned = 0
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            if data.get("version") != VERSION:
+                return
+            self.entries = {name: RomInfo.from_dict(name, entry)
+                            for name, entry in data["roms"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            self.entries = {}
+
+    def save(self):
+        data = {"version": VERSION,
+                "roms": {name: entry.to_dict()
+                         for name, entry in sorted(self.entries.items())}}
+        temporary = self.path + ".tmp"
+        with open(temporary, 'w') as f:
+            json.dump(data, f, indent=1)
+        os.replace(temporary, self.path)
+
+    def update(self):
+        self.scanned = 0
+        entries = {}
+        with os.scandir(self.games) as files:
+            for rom in files:
+                if not rom.is_file():
+                    continue
+                entry = self.entries.get(rom.name)
+                if entry is None or not entry.is_current(rom.stat()):
+                    entry = RomInfo.scan(rom.path)
+                    self.scanned += 1
+                entries[rom.name] = entry
+        changed = self.scanned or entries.keys() != self.entries.keys()
+        self.entries = entries
+        if changed:
+            try:
+                self.save()
+            except OSError:
+                pass
+        return self.roms()
+
+    def roms(self):
+        return [self.entries[name] for name in sorted(self.entries)]
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def find(self, sha1):
+        for entry in self.entries.values():
+            if entry.sha1 == sha1:
+                return entry
+        return None
+
+
+def run(args):
+    catalog = Catalog(args.games, args.catalog)
+    catalog.load()
+    roms = catalog.update()
+    if args.json:
+        print(json.dumps({rom.name: rom.to_dict() for rom in roms},
+                         indent=2))
+        return 0
+    for rom in roms:
+        print("{0:<12}{1}  speed: {2}".format(rom.name, rom.describe(),
+                                              rom.settings["speed"]))
+    print(len(roms), "ROMs,", catalog.scanned, "scanned")
+    return 0
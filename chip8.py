@@ -1,154 +1,154 @@
 #!/usr/bin/python3
 
-from interpreter import Interpreter
-from controller import Controller
+import argparse
 import sys
-from PyQt5 import QtCore, QtGui, QtWidgets, QtMultimedia
-from display import Point
-import datetime
-import re
-import os
-
-
-class MainWindow(QtWidgets.QWidget):
-
-    def __init__(self, game, speed, sprites, state=None):
-        super().__init__()
-        self.game = game
-        self.sound = QtMultimedia.QSound('beep.wav')
-        self.controller = Controller()
-
-        path = os.path.join("games", game)
-        self.interpreter = Interpreter(path, self.controller, sprites,
-                                       self.sound.play)
-        if state is not None:
-            self.interpreter.load_state(state)
-
-        self.display = Display(self)
-        self.display.move(0, 0)
-        self.display.resize(640, 320)
-        self.resize(640, 320)
-        self.show()
-
-        self.timer = QtCore.QTimer()
-        self.timer.timeout.connect(self.main_loop)
-        self.timer.start(10 - (speed / 10))
-
-    def main_loop(self):
-        self.interpreter.execute_next_command()
-        if self.interpreter.need_redraw:
-            self.display.repaint()
-            self.interpreter.need_redraw = False
-        self.interpreter.delay_timer.tick()
-        self.interpreter.sound_timer.tick()
-
-    def keyPressEvent(self, event):
-        if event.key() == QtCore.Qt.Key_F4:
-            self.save_game()
-        else:
-            self.controller.set_key_code(event.key())
-
-    def keyReleaseEvent(self, event):
-        self.controller.release_key()
-
-    def save_game(self):
-        interpreter_state = self.interpreter.serialize_state()
-        path = os.path.join("saves", self.game + "#" +
-                            datetime.datetime.now()
-                            .strftime('%Y-%m-%d %H:%M:%S'))
-        with open(path, "wb") as f:
-            f.write(self.game.encode())
-            f.write(b'\n')
-            f.write(interpreter_state)
-
-
-class Display(QtWidgets.QFrame):
-
-    def __init__(self, parent):
-        super().__init__(parent)
-        self.interpreter = parent.interpreter
-
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        display = self.interpreter.display
-        for x in range(display.WIDTH):
-            for y in range(display.HEIGHT):
-                point = display.get_pixel(Point(x, y))
-                if point == 1:
-                    painter.fillRect(x*10, y*10, 10, 10, QtGui.QColor("white"))
-                else:
-                    painter.fillRect(x*10, y*10, 10, 10, QtGui.QColor("black"))
-
-
-class StartWindow(QtWidgets.QWidget):
-
-    def __init__(self):
-        super().__init__()
-        self.move(100, 100)
-
-        vbox_layout = QtWidgets.QVBoxLayout()
-
-        start_button = QtWidgets.QPushButton(self)
-        start_button.setText("Start")
-        start_button.clicked.connect(self.start_game)
-        vbox_layout.addWidget(start_button)
-
-        change_speed_label = QtWidgets.QLabel("Speed", self)
-        vbox_layout.addWidget(change_speed_label)
-
-        self.sld = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
-        self.sld.setSliderPosition(85)
-        vbox_layout.addWidget(self.sld)
-
-        self.games = QtWidgets.QComboBox()
-        game_list = [game for game in os.listdir("games")]
-        self.games.addItems(game_list)
-        vbox_layout.addWidget(self.games)
-
-        sprites_label = QtWidgets.QLabel("Sprites:", self)
-        vbox_layout.addWidget(sprites_label)
-
-        self.sprites = QtWidgets.QComboBox()
-        sprite_list = [sprite for sprite in os.listdir("sprites")]
-        self.sprites.addItems(sprite_list)
-        vbox_layout.addWidget(self.sprites)
-
-        load_button = QtWidgets.QPushButton(self)
-        load_button.setText("Load game")
-        load_button.clicked.connect(self.load_game)
-        vbox_layout.addWidget(load_button)
-
-        vbox_layout.addStretch(1)
-        self.setLayout(vbox_layout)
-        self.show()
-
-    def start_game(self, *args, **kwargs):
-        path = os.path.join("sprites", self.sprites.currentText())
-        with open(path, "rb") as f:
-            sprites = [byte for byte in f.read()]
-
-        if len(sprites) != 80:
-            raise Exception("Sprites length must be 80 bytes")
-
-        game = self.games.currentText()
-        speed = self.sld.value()
-        self.window = MainWindow(game, speed, sprites)
-
-    def load_game(self):
-        file = QtWidgets.QFileDialog.getOpenFileName(self, "load save",
-                                                     "saves")[0]
-        if file != '':
-            with open(file, "rb") as f:
-                data = f.read()
-                match = re.match(rb"(.*?)\n", data)
-                game = match.group(1).decode()
-                speed = self.sld.value()
-                sprites = self.sprites.currentText()
-                state = data[match.end():]
-                self.window = MainWindow(game, speed, sprites, state)
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(prog="chip8",
+                                     description="CHIP-8 emulator")
+    commands = parser.add_subparsers(dest="command")
+
+    emulation = argparse.ArgumentParser(add_help=False)
+    emulation.add_argument("--cycles", type=int, default=100000,
+                           help="number of instructions to execute")
+    emulation.add_argument("--cycles-per-frame", type=int, default=10,
+                           help="instructions executed per 60 Hz frame")
+    emulation.add_argument("--translate", action="store_true",
+                           help="use the basic-block translator")
+    emulation.add_argument("--sprites", help="path to the 80-byte font")
+    emulation.add_argument("--display", choices=["python", "numpy"],
+                           default="python",
+                           help="framebuffer backend, numpy needs NumPy")
+
+    seeded = argparse.ArgumentParser(add_help=False)
+    seeded.add_argument("--seed", type=int, default=0,
+                        help="seed for the random number generator")
+
+    run_parser = commands.add_parser("run", parents=[emulation, seeded],
+                                     help="run a single ROM")
+    run_parser.add_argument("rom", help="path to the ROM file")
+    run_parser.add_argument("--headless", action="store_true",
+                            help="run without a window")
+    run_parser.add_argument("--input",
+                            help="input script with '<cycle> <key>' lines")
+    run_parser.add_argument("--frame-hashes", action="store_true",
+                            help="print a framebuffer hash for every frame")
+    run_parser.add_argument("--profile", metavar="JSON",
+                            help="profile opcodes and addresses and write "
+                                 "the results to this file")
+
+    batch_parser = commands.add_parser("batch",
+                                       parents=[emulation, seeded],
+                                       help="run many ROMs in parallel")
+    batch_parser.add_argument("roms", nargs="+",
+                              help="ROM files or directories of ROMs")
+    batch_parser.add_argument("--input", action="append", default=[],
+                              help="input script, every ROM is run with "
+                                   "every script")
+    batch_parser.add_argument("--processes", type=int,
+                              help="worker processes, defaults to the "
+                                   "number of cores")
+    batch_parser.add_argument("--json", action="store_true",
+                              help="print the report as JSON")
+
+    replay_parser = commands.add_parser("replay",
+                                        help="replay a recorded movie")
+    replay_parser.add_argument("movie", help="path to the movie file")
+    replay_parser.add_argument("rom", help="ROM the movie was recorded with")
+    replay_parser.add_argument("--seek", type=int, default=0,
+                               help="start at this frame, using the nearest "
+                                    "keyframe")
+    replay_parser.add_argument("--frames", type=int,
+                               help="number of frames to replay, defaults "
+                                    "to the rest of the movie")
+    replay_parser.add_argument("--frame-hashes", action="store_true",
+                               help="print a framebuffer hash for every "
+                                    "frame")
+    replay_parser.add_argument("--translate", action="store_true",
+                               help="use the basic-block translator")
+    replay_parser.add_argument("--sprites",
+                               help="path to the 80-byte font")
+
+    serve_parser = commands.add_parser("serve", parents=[seeded],
+                                       help="run a ROM for network "
+                                            "spectators")
+    serve_parser.add_argument("rom", help="path to the ROM file")
+    serve_parser.add_argument("--host", default="127.0.0.1",
+                              help="address to listen on")
+    serve_parser.add_argument("--port", type=int, default=8064,
+                              help="TCP port to listen on")
+    serve_parser.add_argument("--cycles-per-frame", type=int, default=10,
+                              help="instructions executed per 60 Hz frame")
+    serve_parser.add_argument("--translate", action="store_true",
+                              help="use the basic-block translator")
+    serve_parser.add_argument("--sprites", help="path to the 80-byte font")
+
+    watch_parser = commands.add_parser("watch",
+                                       help="connect to a running server")
+    watch_parser.add_argument("--host", default="127.0.0.1",
+                              help="address of the server")
+    watch_parser.add_argument("--port", type=int, default=8064,
+                              help="TCP port of the server")
+    watch_parser.add_argument("--frames", type=int,
+                              help="stop after this many frames")
+    watch_parser.add_argument("--key", action="append", default=[],
+                              help="hex key to press after connecting, "
+                                   "repeat for more keys")
+    watch_parser.add_argument("--ascii", action="store_true",
+                              help="draw every received frame")
+
+    catalog_parser = commands.add_parser("catalog",
+                                         help="list ROMs with their cached "
+                                              "analysis")
+    catalog_parser.add_argument("games", nargs="?", default="games",
+                                help="directory of ROMs")
+    catalog_parser.add_argument("--catalog", default="catalog.json",
+                                help="cache file, rebuilt for ROMs whose "
+                                     "size or mtime changed")
+    catalog_parser.add_argument("--json", action="store_true",
+                                help="print the catalog as JSON")
+    return parser
+
+
+def main(argv=None):
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        import window
+        return window.main()
+
+    if args.command == "watch":
+        import server
+        return server.watch(args)
+
+    if args.command == "catalog":
+        import catalog
+        return catalog.run(args)
+
+    import headless
+    if args.sprites is None:
+        args.sprites = headless.DEFAULT_SPRITES
+
+    if args.command == "run":
+        if not args.headless:
+            parser.error("run needs --headless, start without arguments "
+                         "to open the window")
+        return headless.run(args)
+
+    if args.command == "batch":
+        import batch
+        return batch.run(args)
+
+    if args.command == "replay":
+        import movie
+        return movie.run(args)
+
+    if args.command == "serve":
+        import server
+        return server.run(args)
 
 
 if __name__ == '__main__':
-    app = QtWidgets.QApplication(sys.argv)
-    window = StartWindow()
-    sys.exit(app.exec_())
+    sys.exit(main())
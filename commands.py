@@ -1,8 +1,6 @@
 #!/usr/bin/python3
 
-import random
-
-from display import Point
+from opcodes import draw_sprite
 
 
 class Command:
@@ -53,7 +51,8 @@ class Command:
     class Add(BaseCommand):
 
         def execute_command(self, register, value):
-            self.interpreter.V[0xf].value = int(register.value + value > 0xff)
+            self.interpreter.registers[0xf] = \
+                register.value + value > 0xff
             register.value += value
 
     class Or(BaseCommand):
@@ -74,68 +73,48 @@ class Command:
     class Sub(BaseCommand):
 
         def execute_command(self, register, value):
-            self.interpreter.V[0xf].value = int(register.value > value)
+            self.interpreter.registers[0xf] = register.value > value
             register.value = register.value - value
 
     class SubN(BaseCommand):
 
         def execute_command(self, register, value):
-            self.interpreter.V[0xf].value = int(value > register.value)
+            self.interpreter.registers[0xf] = value > register.value
             register.value = value - register.value
 
     class ShiftRight(BaseCommand):
 
         def execute_command(self, register, value):
-            self.interpreter.V[0xf].value = register.value & 1
+            self.interpreter.registers[0xf] = register.value & 1
             register.value = register.value >> 1
 
     class ShiftLeft(BaseCommand):
 
         def execute_command(self, register, value):
-            self.interpreter.V[0xf].value = int(register.value & 0x80 != 0)
+            self.interpreter.registers[0xf] = register.value >> 7
             register.value = register.value << 1
 
     class Random(BaseCommand):
 
         def execute_command(self, register, value):
-            rand = random.randint(0, 255)
+            rand = self.interpreter.random.next_byte()
             register.value = rand & value
 
     class Draw(BaseCommand):
 
-        def _get_bits(self, number):
-            bits = list(map(int, bin(number)[2:]))
-            bits = [0]*(8 - len(bits)) + bits
-
-            return tuple(bits)
-
         def execute_command(self, x, y, lines):
-            self.interpreter.need_redraw = True
-            self.interpreter.V[0xf].value = 0
-            for line in range(lines):
-                memory_data = self.interpreter.memory\
-                        .get_value(self.interpreter.I.value + line)
-                bits = self._get_bits(memory_data)
-                for bit_number, bit in enumerate(bits):
-                    pixel_pos = Point(x + bit_number, y + line)
-                    current_bit = self.interpreter.display.get_pixel(pixel_pos)
-                    if bit == 1 and current_bit == 1:
-                        self.interpreter.V[0xf].value = 1
-                    self.interpreter.display.set_pixel(pixel_pos,
-                                                       bit ^ current_bit)
+            draw_sprite(self.interpreter, x, y, lines)
 
     class CheckPushed(BaseCommand):
 
         def execute_command(self, value):
-            key_code = self.interpreter.get_key_code()
-            if key_code == value:
+            if self.interpreter.is_key_pressed(value):
                 self.interpreter.instruction_pointer += 2
 
     class CheckNotPushed(BaseCommand):
 
         def execute_command(self, value):
-            key_code = self.interpreter.get_key_code()
-            if key_code != value:
+            if not self.interpreter.is_key_pressed(value):
                 self.interpreter.instruction_pointer += 2
 
     class SetDelayTimer(BaseCommand):
@@ -149,8 +128,10 @@ class Command:
             key_code = self.interpreter.get_key_code()
             if key_code is None:
                 self.interpreter.instruction_pointer -= 2
+                self.interpreter.waiting_for_key = True
             else:
                 register.value = key_code
+                self.interpreter.waiting_for_key = False
 
     class SetSoundTimer(BaseCommand):
 
@@ -160,7 +141,7 @@ class Command:
     class SetSymbolLocation(BaseCommand):
 
         def execute_command(self, character_code):
-            self.interpreter.I.value = character_code * 5
+            self.interpreter.index = character_code * 5
 
     class StoreDecimalToMemory(BaseCommand):
 
@@ -170,22 +151,22 @@ class Command:
 
         def execute_command(self, value):
             decimal = self._get_decimal_representation(value)
-            for i, number in enumerate(decimal):
-                self.interpreter.memory\
-                    .store_value(self.interpreter.I.value + i, number)
+            self.interpreter.memory.load(self.interpreter.index,
+                                         bytes(decimal))
+            self.interpreter.invalidate_code(self.interpreter.index,
+                                             len(decimal))
 
     class StoreRegisters(BaseCommand):
 
         def execute_command(self, register_number):
-            for i in range(register_number + 1):
-                value = self.interpreter.V[i].value
-                self.interpreter.memory\
-                    .store_value(self.interpreter.I.value + i, value)
+            values = self.interpreter.registers[:register_number + 1]
+            self.interpreter.memory.load(self.interpreter.index, values)
+            self.interpreter.invalidate_code(self.interpreter.index,
+                                             register_number + 1)
 
     class LoadRegisters(BaseCommand):
 
         def execute_command(self, register_number):
-            for i in range(register_number + 1):
-                value = self.interpreter.memory\
-                    .get_value(self.interpreter.I.value + i)
-                self.interpreter.V[i].value = value
+            values = self.interpreter.memory.view(self.interpreter.index,
+                                                  register_number + 1)
+            self.interpreter.registers[:register_number + 1] = values
@@ -1,37 +1,73 @@
 #!/usr/bin/python3
 
-from PyQt5.QtCore import Qt
+import collections
+import time
+
+KEYS = 16
+ALL_KEYS = (1 << KEYS) - 1
+
+
+def key_mask(key):
+    return 0 if key is None else 1 << key
+
+
+def lowest_key(mask):
+    if not mask:
+        return None
+    return (mask & -mask).bit_length() - 1
 
 
 class Controller:
 
     def __init__(self):
-        self._return_value = None
+        self.pressed = 0
+        self._events = collections.deque()
 
     def get_key_code(self):
-        return self._return_value
+        return lowest_key(self.pressed)
+
+    def is_pressed(self, key):
+        return self.pressed >> key & 1 == 1
 
     def set_key_code(self, key):
-        codes = {
-            Qt.Key_0: 0,
-            Qt.Key_1: 1,
-            Qt.Key_2: 2,
-            Qt.Key_3: 3,
-            Qt.Key_Q: 4,
-            Qt.Key_W: 5,
-            Qt.Key_E: 6,
-            Qt.Key_R: 7,
-            Qt.Key_A: 8,
-            Qt.Key_S: 9,
-            Qt.Key_D: 10,
-            Qt.Key_F: 11,
-            Qt.Key_Z: 12,
-            Qt.Key_X: 13,
-            Qt.Key_C: 14,
-            Qt.Key_V: 15
-        }
-        if key in codes:
-            self._return_value = codes[key]
-
-    def release_key(self):
-        self._return_value = None
+        self.pressed = key_mask(key)
+
+    def set_keys(self, mask):
+        self.pressed = mask & ALL_KEYS
+
+    def press(self, key, timestamp=None):
+        self.queue_event(key, True, timestamp)
+
+    def release(self, key, timestamp=None):
+        self.queue_event(key, False, timestamp)
+
+    def queue_event(self, key, pressed, timestamp=None):
+        if not 0 <= key < KEYS:
+            raise Exception("there is no key " + str(key))
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        self._events.append((timestamp, key, pressed))
+
+    @property
+    def pending_events(self):
+        return len(self._events)
+
+    def clear_events(self):
+        self._events.clear()
+
+    def apply_events(self, until=None):
+        events = self._events
+        changed = 0
+        while events:
+            timestamp, key, pressed = events[0]
+            if until is not None and timestamp > until:
+                break
+            bit = 1 << key
+            if changed & bit:
+                break
+            events.popleft()
+            if pressed:
+                self.pressed |= bit
+            else:
+                self.pressed &= ~bit
+            changed |= bit
@@ -28,11 +28,13 @@ class Point:
 
 class Display:
 
-    def __init__(self):
-        self._pixels = {}
-
     WIDTH = 64
     HEIGHT = 32
+    ROW_MASK = (1 << WIDTH) - 1
+
+    def __init__(self):
+        self._pixels = [0] * Display.HEIGHT
+        self._dirty_rows = 0
 
     @staticmethod
     def get_correct_point(point):
@@ -43,13 +45,74 @@ class Display:
 
     def set_pixel(self, point, value):
         point = Display.get_correct_point(point)
-        self._pixels[point] = value
+        bit = 1 << (Display.WIDTH - 1 - point.x)
+        self._dirty_rows |= 1 << point.y
+        if value:
+            self._pixels[point.y] |= bit
+        else:
+            self._pixels[point.y] &= ~bit
 
     def get_pixel(self, point):
         point = Display.get_correct_point(point)
-        if point in self._pixels:
-            return self._pixels[point]
-        return 0
+        return self._pixels[point.y] >> (Display.WIDTH - 1 - point.x) & 1
+
+    def get_row(self, y):
+        return self._pixels[y]
+
+    def draw_sprite(self, x, y, sprite):
+        x %= Display.WIDTH
+        y %= Display.HEIGHT
+        shift = Display.WIDTH - 8 - x
+        rows = self._pixels
+        collision = 0
+        dirty_rows = 0
+        for line, byte in enumerate(sprite):
+            if shift >= 0:
+                mask = byte << shift
+            else:
+                mask = byte >> -shift | \
+                       byte << (Display.WIDTH + shift) & Display.ROW_MASK
+            row_number = (y + line) % Display.HEIGHT
+            row = rows[row_number]
+            collision |= row & mask
+            rows[row_number] = row ^ mask
+            if mask:
+                dirty_rows |= 1 << row_number
+        self._dirty_rows |= dirty_rows
+        return collision != 0
+
+    def to_bytes(self):
+        return b''.join(row.to_bytes(Display.WIDTH // 8, 'big')
+                        for row in self._pixels)
+
+    def load_bytes(self, data):
+        row_size = Display.WIDTH // 8
+        self._pixels = [int.from_bytes(data[y * row_size:(y + 1) * row_size],
+                                       'big')
+                        for y in range(Display.HEIGHT)]
+        self._dirty_rows = (1 << Display.HEIGHT) - 1
 
     def clear(self):
-        self._pixels.clear()
+        for row_number, row in enumerate(self._pixels):
+            if row:
+                self._dirty_rows |= 1 << row_number
+        self._pixels = [0] * Display.HEIGHT
+
+    def take_dirty_rows(self):
+        dirty_rows = self._dirty_rows
+        self._dirty_rows = 0
+        return dirty_row_spans(dirty_rows)
+
+
+def dirty_row_spans(dirty_rows):
+    spans = []
+    row_number = 0
+    while dirty_rows:
+        if dirty_rows & 1:
+            if spans and spans[-1][0] + spans[-1][1] == row_number:
+                spans[-1] = (spans[-1][0], spans[-1][1] + 1)
+            else:
+                spans.append((row_number, 1))
+        dirty_rows >>= 1
+        row_number += 1
+    return spans
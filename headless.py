@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+
+import hashlib
+import os
+import time
+
+from controller import Controller
+from display import Display
+from interpreter import Interpreter, load_sprites
+from numpy_display import display_class
+from scheduler import Scheduler
+
+
+DEFAULT_SPRITES = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               "sprites", "default")
+
+
+def read_input_script(path):
+    events = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                cycle, key = line.split()
+                events.append((int(cycle),
+                               None if key == '-' else int(key, 16)))
+            except ValueError:
+                raise Exception("Wrong input script line " +
+                                str(line_number) + ": " + line)
+    events.sort(key=lambda event: event[0])
+    return events
+
+
+def state_hash(interpreter):
+    return hashlib.sha1(interpreter.serialize_state()).hexdigest()
+
+
+def frame_hash(interpreter):
+    return hashlib.sha1(interpreter.display.to_bytes()).hexdigest()
+
+
+class RunResult:
+
+    def __init__(self, instructions, seconds, state_hash, frame_hashes):
+        self.instructions = instructions
+        self.seconds = seconds
+        self.state_hash = state_hash
+        self.frame_hashes = frame_hashes
+
+    @property
+    def instructions_per_second(self):
+        if self.seconds == 0:
+            return 0
+        return self.instructions / self.seconds
+
+
+class HeadlessRunner:
+
+    def __init__(self, game_file, sprites, cycles_per_frame=10,
+                 use_translator=False, seed=None, display_class=Display):
+        self.sprites = sprites
+        self.controller = Controller()
+        self.interpreter = Interpreter(game_file, self.controller, sprites,
+                                       seed=seed,
+                                       display_class=display_class)
+        self.scheduler = Scheduler(self.interpreter, cycles_per_frame,
+                                   use_translator=use_translator)
+
+    def reset(self, game_file):
+        self.controller.set_key_code(None)
+        self.controller.clear_events()
+        self.interpreter.reset(game_file, self.sprites)
+
+    def run(self, cycles, events=(), record_frames=False, key_masks=False):
+        scheduler = self.scheduler
+        if key_masks:
+            apply_event = self.controller.set_keys
+        else:
+            apply_event = self.controller.set_key_code
+        events = list(events)
+        next_event = 0
+        executed = 0
+        frame_hashes = []
+        start = time.perf_counter()
+        while executed < cycles:
+            frame_end = min(executed + scheduler.instructions_per_frame,
+                            cycles)
+            while executed < frame_end:
+                while next_event < len(events) and \
+                        events[next_event][0] <= executed:
+                    apply_event(events[next_event][1])
+                    next_event += 1
+                stop = frame_end
+                if next_event < len(events):
+                    stop = min(stop, events[next_event][0])
+                executed += scheduler.execute(stop - executed)
+            scheduler.end_frame()
+            if record_frames:
+                frame_hashes.append(frame_hash(self.interpreter))
+        seconds = time.perf_counter() - start
+        return RunResult(executed, seconds, state_hash(self.interpreter),
+                         frame_hashes)
+
+
+def run(args):
+    sprites = load_sprites(args.sprites)
+    events = read_input_script(args.input) if args.input else []
+    runner = HeadlessRunner(args.rom, sprites, args.cycles_per_frame,
+                            args.translate, args.seed,
+                            display_class(args.display))
+    if args.profile:
+        runner.scheduler.start_profiling()
+    result = runner.run(args.cycles, events, args.frame_hashes)
+    if args.profile:
+        profiler = runner.scheduler.stop_profiling()
+        profiler.dump(args.profile)
+        print(profiler.format())
+    for frame_number, frame in enumerate(result.frame_hashes, 1):
+        print("frame", frame_number, frame)
+    print("instructions:", result.instructions)
+    print("seconds: {0:.3f}".format(result.seconds))
+    print("instructions/sec: {0:.0f}".format(result.instructions_per_second))
+    print("state hash:", result.state_hash)
+    return 0
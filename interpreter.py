@@ -1,34 +1,88 @@
 #!/usr/bin/python3
 
+import time
+
 import memory
+import opcodes
 from commands import Command
 from display import Display, Point
-import struct
-import pickle
+from profiler import Profiler
+import savestate
 import timer
+from rng import XorShiftRandom
+
+
+def load_sprites(path):
+    with open(path, "rb") as f:
+        sprites = [byte for byte in f.read()]
+
+    if len(sprites) != 80:
+        raise Exception("Sprites length must be 80 bytes")
+    return sprites
 
 
 class Interpreter:
 
+    ARITHMETIC_COMMANDS = {0: Command.Move,
+                           1: Command.Or,
+                           2: Command.And,
+                           3: Command.Xor,
+                           4: Command.Add,
+                           5: Command.Sub,
+                           6: Command.ShiftRight,
+                           7: Command.SubN,
+                           0xe: Command.ShiftLeft}
+
     def __init__(self, game_file, controller, sprites,
-                 play_sound_func=timer.empty_func):
+                 play_sound_func=timer.empty_func, display_class=Display,
+                 seed=None):
         self.controller = controller
-        self.V = [memory.Register(8) for _ in range(16)]
-        self.I = memory.Register(16)
+        self.seed = seed
+        self.random = XorShiftRandom(seed)
+        self.registers = bytearray(16)
+        self.index = 0
+        self.V = [memory.RegisterView(self.registers, number)
+                  for number in range(16)]
+        self.I = memory.IndexView(self)
         self.instruction_pointer = 0x200
         self.memory = memory.Memory()
         self.stack = memory.Stack()
-        self.display = Display()
+        self.display = display_class()
+        self._decoded = [None] * 4096
+        self.code_write_listeners = []
+        self.profiler = None
+        self.skip_idle_loops = False
+        self.waiting_for_key = False
         self.delay_timer = timer.Timer()
-        self.sound_timer = timer.Timer(end_timer_func=play_sound_func)
+        self.play_sound_func = play_sound_func
+        self.muted = False
+        self.sound_timer = timer.Timer(end_timer_func=self.play_sound)
+        self.reset(game_file, sprites)
+
+    def reset(self, game_file, sprites):
+        self.random.seed(self.seed)
+        self.registers[:] = bytes(16)
+        self.index = 0
+        self.instruction_pointer = 0x200
+        self.memory.clear()
+        self.invalidate_code(0, 4096)
+        self.stack.clear()
+        self.display.clear()
+        self.delay_timer.ticks = 0
+        self.sound_timer.ticks = 0
         with open(game_file, 'rb') as f:
             self.load_commands(f.read())
         self.initialize_sprites(sprites)
         self._need_redraw = False
+        self.waiting_for_key = False
+
+    def play_sound(self):
+        if not self.muted:
+            self.play_sound_func()
 
     def initialize_sprites(self, sprites):
-        for i, sprite_line in enumerate(sprites):
-            self.memory.store_value(i, sprite_line)
+        self.memory.load(0, bytes(sprites))
+        self.invalidate_code(0, len(sprites))
 
     def read_instruction(self):
         first_value = self.memory.get_value(self.instruction_pointer)
@@ -36,106 +90,122 @@ class Interpreter:
         return first_value << 8 | second_value
 
     def load_commands(self, data):
-        for i, char in enumerate(data):
-            self.memory.store_value(0x200 + i, char)
+        self.memory.load(0x200, data)
+        self.invalidate_code(0x200, len(data))
 
     def get_key_code(self):
         return self.controller.get_key_code()
 
+    def is_key_pressed(self, key):
+        return self.controller.is_pressed(key)
+
     def decode(self, code):
+        command_type, bind_arguments = self._bind_command(code)
+        return (command_type,) + bind_arguments(self)
 
+    def _bind_command(self, code):
         command_number = (code & 0xf000) >> 12
-        first_register = self.V[(code & 0x0f00) >> 8]
-        second_register = self.V[(code & 0x00f0) >> 4]
+        x = (code & 0x0f00) >> 8
+        y = (code & 0x00f0) >> 4
+        n = code & 0x000f
+        kk = code & 0x00ff
+        nnn = code & 0x0fff
 
         if command_number == 0x0:
             if code == 0x00e0:
-                return Command.Clear,
+                return Command.Clear, lambda self: ()
             elif code == 0x00ee:
-                return Command.Return,
+                return Command.Return, lambda self: ()
 
         elif command_number == 0x1:
-            return Command.Jump, code & 0x0fff
+            return Command.Jump, lambda self: (nnn,)
 
         elif command_number == 0x2:
-            return Command.Call, code & 0x0fff
+            return Command.Call, lambda self: (nnn,)
 
         elif command_number == 0x3:
-            return Command.PassIfEqual, first_register.value, code & 0x00ff
+            return Command.PassIfEqual, lambda self: (self.V[x].value, kk)
 
         elif command_number == 0x4:
-            return Command.PassIfNotEqual, first_register.value, code & 0x00ff
+            return Command.PassIfNotEqual, lambda self: (self.V[x].value, kk)
 
         elif command_number == 0x5:
-            if code & 0x000f == 0:
-                return Command.PassIfEqual, first_register.value,\
-                       second_register.value
+            if n == 0:
+                return Command.PassIfEqual,\
+                       lambda self: (self.V[x].value, self.V[y].value)
 
         elif command_number == 0x6:
-            return Command.Move, first_register, code & 0x00ff
+            return Command.Move, lambda self: (self.V[x], kk)
 
         elif command_number == 0x7:
-            return Command.Move, first_register,\
-                   first_register.value + code & 0x00ff
+            return Command.Move,\
+                   lambda self: (self.V[x], (self.V[x].value + kk) & 0xff)
 
         elif command_number == 0x8:
-            commands = {0: Command.Move,
-                        1: Command.Or,
-                        2: Command.And,
-                        3: Command.Xor,
-                        4: Command.Add,
-                        5: Command.Sub,
-                        6: Command.ShiftRight,
-                        7: Command.SubN,
-                        0xe: Command.ShiftLeft}
-            if code & 0x000f in commands:
-                return commands[code & 0xf], first_register,\
-                       second_register.value
+            if n in self.ARITHMETIC_COMMANDS:
+                return self.ARITHMETIC_COMMANDS[n],\
+                       lambda self: (self.V[x], self.V[y].value)
 
         elif command_number == 0x9:
-            if code & 0x000f == 0:
-                return Command.PassIfNotEqual, first_register.value,\
-                       second_register.value
+            if n == 0:
+                return Command.PassIfNotEqual,\
+                       lambda self: (self.V[x].value, self.V[y].value)
 
         elif command_number == 0xa:
-            return Command.Move, self.I, code & 0x0fff
+            return Command.Move, lambda self: (self.I, nnn)
 
         elif command_number == 0xb:
-            return Command.Jump, (code & 0x0fff) + self.V[0].value
+            return Command.Jump, lambda self: (nnn + self.V[0].value,)
 
         elif command_number == 0xc:
-            return Command.Random, first_register, code & 0x00ff
+            return Command.Random, lambda self: (self.V[x], kk)
 
         elif command_number == 0xd:
-            return Command.Draw, first_register.value, second_register.value,\
-                   code & 0x000f
+            return Command.Draw,\
+                   lambda self: (self.V[x].value, self.V[y].value, n)
 
         elif command_number == 0xe:
-            if code & 0x00ff == 0x9e:
-                return Command.CheckPushed, first_register.value
+            if kk == 0x9e:
+                return Command.CheckPushed, lambda self: (self.V[x].value,)
 
-            elif code & 0x00ff == 0xa1:
-                return Command.CheckNotPushed, first_register.value
+            elif kk == 0xa1:
+                return Command.CheckNotPushed,\
+                       lambda self: (self.V[x].value,)
 
         elif command_number == 0xf:
-            first_register_number = (code & 0x0f00) >> 8
-            commands = {
-                0x07: (Command.Move, first_register, self.delay_timer.ticks),
-                0x0a: (Command.WaitPushing, first_register),
-                0x15: (Command.SetDelayTimer, first_register.value),
-                0x18: (Command.SetSoundTimer, first_register.value),
-                0x1e: (Command.Move, self.I, self.I.value +
-                       first_register.value),
-                0x29: (Command.SetSymbolLocation, first_register.value),
-                0x33: (Command.StoreDecimalToMemory, first_register.value),
-                0x55: (Command.StoreRegisters, first_register_number),
-                0x65: (Command.LoadRegisters, first_register_number)
+            binders = {
+                0x07: (Command.Move,
+                       lambda self: (self.V[x], self.delay_timer.ticks)),
+                0x0a: (Command.WaitPushing, lambda self: (self.V[x],)),
+                0x15: (Command.SetDelayTimer,
+                       lambda self: (self.V[x].value,)),
+                0x18: (Command.SetSoundTimer,
+                       lambda self: (self.V[x].value,)),
+                0x1e: (Command.Move,
+                       lambda self: (self.I, self.I.value + self.V[x].value)),
+                0x29: (Command.SetSymbolLocation,
+                       lambda self: (self.V[x].value,)),
+                0x33: (Command.StoreDecimalToMemory,
+                       lambda self: (self.V[x].value,)),
+                0x55: (Command.StoreRegisters, lambda self: (x,)),
+                0x65: (Command.LoadRegisters, lambda self: (x,))
                 }
-            if code & 0x00ff in commands:
-                return commands[code & 0x00ff]
+            if kk in binders:
+                return binders[kk]
 
         raise Exception("Wrong command code: " + hex(code))
 
+    def invalidate_code(self, address, length=1):
+        address &= 0xfff
+        if address + length > 4096:
+            self.invalidate_code(0, address + length - 4096)
+            length = 4096 - address
+        start = max(address - 1, 0)
+        end = address + length
+        self._decoded[start:end] = [None] * (end - start)
+        for listener in self.code_write_listeners:
+            listener(address, length)
+
     @property
     def need_redraw(self):
         return self._need_redraw
@@ -144,24 +214,58 @@ class Interpreter:
     def need_redraw(self, value):
         self._need_redraw = value
 
+    def _predecode(self, address):
+        decoded = opcodes.predecode(self.read_instruction())
+        if decoded[0] is opcodes.jump and \
+                opcodes.may_be_idle_jump(address, decoded[3]):
+            decoded = (opcodes.idle_jump,) + decoded[1:]
+        self._decoded[address] = decoded
+        return decoded
+
+    def finish_idle_loop(self, loop_length, cycles):
+        for _ in range(cycles % loop_length):
+            self.execute_next_command()
+
     def execute_next_command(self):
-        code = self.read_instruction()
-        command_type, *args = self.decode(code)
-        command = command_type(self)
-        self.instruction_pointer += 2
-        command.execute_command(*args)
+        address = self.instruction_pointer
+        decoded = self._decoded[address]
+        if decoded is None:
+            decoded = self._predecode(address)
+        handler, x, y, value = decoded
+        self.instruction_pointer = address + 2
+        handler(self, x, y, value)
+
+    def _execute_next_command_profiled(self):
+        address = self.instruction_pointer
+        decoded = self._decoded[address]
+        if decoded is None:
+            decoded = self._predecode(address)
+        handler, x, y, value = decoded
+        profiler = self.profiler
+        if handler not in profiler.families:
+            command_type = self._bind_command(self.read_instruction())[0]
+            profiler.families[handler] = command_type.__name__
+        self.instruction_pointer = address + 2
+        start = time.perf_counter()
+        handler(self, x, y, value)
+        profiler.record(address, handler, time.perf_counter() - start)
+
+    def start_profiling(self, profiler=None):
+        self.profiler = profiler or Profiler()
+        self.execute_next_command = self._execute_next_command_profiled
+        return self.profiler
+
+    def stop_profiling(self):
+        profiler = self.profiler
+        if profiler is None:
+            raise Exception("profiling is not running")
+        del self.execute_next_command
+        self.profiler = None
+        profiler.stop()
+        return profiler
 
     def serialize_state(self):
-        return pickle.dumps(self)
+        return savestate.SaveState.from_interpreter(self).to_bytes()
 
     def load_state(self, state):
-        interpreter = pickle.loads(state)
-        for i in range(16):
-            self.V[i].value = interpreter.V[i].value
-        self.I.value = interpreter.I.value
-        self.instruction_pointer = interpreter.instruction_pointer
-        self.memory = interpreter.memory
-        self.stack = interpreter.stack
-        self.display = interpreter.display
-        self.delay_timer.ticks = interpreter.delay_timer.ticks
-        self.sound_timer.ticks = interpreter.sound_timer.ticks
+        savestate.decode(state).apply(self)
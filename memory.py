@@ -3,21 +3,40 @@
 
 class Memory:
 
-    def __init__(self):
-        self._memory = [0 for _ in range(4096)]
+    SIZE = 4096
 
-    def _check_address(self, address):
-        if not 0 <= address <= 4095:
-            raise Exception("address " + address +
-                            " was outside of the memory")
+    def __init__(self):
+        self._memory = bytearray(Memory.SIZE)
 
     def store_value(self, address, value):
-        self._check_address(address)
-        self._memory[address] = value
+        self._memory[address & 0xfff] = value & 0xff
 
     def get_value(self, address):
-        self._check_address(address)
-        return self._memory[address]
+        return self._memory[address & 0xfff]
+
+    def clear(self):
+        self._memory[:] = bytes(Memory.SIZE)
+
+    def load(self, offset, data):
+        if len(data) > Memory.SIZE:
+            raise Exception("data of " + str(len(data)) +
+                            " bytes does not fit into the memory")
+        offset &= 0xfff
+        end = offset + len(data)
+        if end <= Memory.SIZE:
+            self._memory[offset:end] = data
+        else:
+            split = Memory.SIZE - offset
+            self._memory[offset:] = data[:split]
+            self._memory[:end - Memory.SIZE] = data[split:]
+
+    def view(self, start, length):
+        start &= 0xfff
+        end = start + length
+        if end <= Memory.SIZE:
+            return memoryview(self._memory)[start:end]
+        return bytes(self._memory[start:] +
+                     self._memory[:end - Memory.SIZE])
 
 
 class Stack:
@@ -30,6 +49,21 @@ class Stack:
     def length(self):
         return self._stack_pointer
 
+    def clear(self):
+        self._memory = [0 for _ in range(16)]
+        self._stack_pointer = 0
+
+    def load(self, items):
+        if len(items) > 15:
+            raise Exception("Stack is full")
+        self.clear()
+        self._memory[:len(items)] = items
+        self._stack_pointer = len(items)
+
+    @property
+    def items(self):
+        return self._memory[:self._stack_pointer]
+
     def push(self, value):
         if self._stack_pointer == 15:
             raise Exception("Stack is full")
@@ -43,16 +77,30 @@ class Stack:
         return self._memory[self._stack_pointer]
 
 
-class Register:
+class RegisterView:
+
+    def __init__(self, registers, number):
+        self._registers = registers
+        self._number = number
+
+    @property
+    def value(self):
+        return self._registers[self._number]
+
+    @value.setter
+    def value(self, argument):
+        self._registers[self._number] = argument & 0xff
+
+
+class IndexView:
 
-    def __init__(self, bits):
-        self._bits = bits
-        self._value = 0
+    def __init__(self, interpreter):
+        self._interpreter = interpreter
 
     @property
     def value(self):
-        return self._value % 2**self._bits
+        return self._interpreter.index
 
     @value.setter
     def value(self, argument):
-        self._value = argument
+        self._interpreter.index = argument & 0xffff
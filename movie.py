@@ -0,0 +1,275 @@
+#!/usr/bin/python3
+
+import bisect
+import hashlib
+import struct
+import zlib
+
+from controller import key_mask, lowest_key
+from headless import HeadlessRunner, frame_hash, state_hash
+from interpreter import load_sprites
+
+MAGIC = b'CH8M'
+VERSION = 2
+
+HEADER = struct.Struct('>4sH20sHH')
+EVENTS = {1: struct.Struct('>QB'), 2: struct.Struct('>QH')}
+KEYFRAMES = {1: struct.Struct('>IQBI'), 2: struct.Struct('>IQHI')}
+EVENT = EVENTS[VERSION]
+KEYFRAME = KEYFRAMES[VERSION]
+END = struct.Struct('>IQ20s')
+
+EVENT_TAG = b'E'
+KEYFRAME_TAG = b'K'
+END_TAG = b'Z'
+
+NO_KEY = 0xff
+
+
+def rom_hash(game_file):
+    with open(game_file, 'rb') as f:
+        return hashlib.sha1(f.read()).digest()
+
+
+def _unpack_keys(version, keys):
+    if version == 1:
+        return key_mask(None if keys == NO_KEY else keys)
+    return keys
+
+
+class Keyframe:
+
+    def __init__(self, frame, cycle, keys, state):
+        self.frame = frame
+        self.cycle = cycle
+        self.keys = keys
+        self.state = state
+
+
+class Movie:
+
+    def __init__(self, rom_hash, cycles_per_frame, keyframe_interval=120):
+        self.rom_hash = rom_hash
+        self.cycles_per_frame = cycles_per_frame
+        self.keyframe_interval = keyframe_interval
+        self.events = []
+        self.keyframes = []
+        self.frames = 0
+        self.cycles = 0
+        self.state_hash = None
+
+    def keyframe_before(self, frame):
+        frames = [keyframe.frame for keyframe in self.keyframes]
+        index = bisect.bisect_right(frames, frame) - 1
+        if index < 0:
+            raise Exception("movie has no keyframe before frame " +
+                            str(frame))
+        return self.keyframes[index]
+
+    def to_bytes(self):
+        chunks = [HEADER.pack(MAGIC, VERSION, self.rom_hash,
+                              self.cycles_per_frame, self.keyframe_interval)]
+        events = iter(self.events)
+        event = next(events, None)
+        for keyframe in self.keyframes:
+            while event is not None and event[0] <= keyframe.cycle:
+                chunks.append(EVENT_TAG + EVENT.pack(*event))
+                event = next(events, None)
+            state = zlib.compress(keyframe.state, 1)
+            chunks.append(KEYFRAME_TAG +
+                          KEYFRAME.pack(keyframe.frame, keyframe.cycle,
+                                        keyframe.keys, len(state)) +
+                          state)
+        while event is not None:
+            chunks.append(EVENT_TAG + EVENT.pack(*event))
+            event = next(events, None)
+        chunks.append(END_TAG + END.pack(self.frames, self.cycles,
+                                         bytes.fromhex(self.state_hash)))
+        return b''.join(chunks)
+
+    @staticmethod
+    def from_bytes(data):
+        if len(data) < HEADER.size:
+            raise Exception("movie is too short")
+        magic, version, rom_hash, cycles_per_frame, keyframe_interval = \
+            HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise Exception("not a CHIP-8 movie")
+        if version not in EVENTS:
+            raise Exception("unsupported movie version " + str(version))
+        event_chunk = EVENTS[version]
+        keyframe_chunk = KEYFRAMES[version]
+        movie = Movie(rom_hash, cycles_per_frame, keyframe_interval)
+        offset = HEADER.size
+        try:
+            while True:
+                tag = data[offset:offset + 1]
+                offset += 1
+                if tag == EVENT_TAG:
+                    cycle, keys = event_chunk.unpack_from(data, offset)
+                    offset += event_chunk.size
+                    movie.events.append((cycle,
+                                         _unpack_keys(version, keys)))
+                elif tag == KEYFRAME_TAG:
+                    frame, cycle, keys, length = \
+                        keyframe_chunk.unpack_from(data, offset)
+                    offset += keyframe_chunk.size
+                    state = zlib.decompress(data[offset:offset + length])
+                    offset += length
+                    movie.keyframes.append(
+                        Keyframe(frame, cycle, _unpack_keys(version, keys),
+                                 state))
+                elif tag == END_TAG:
+                    movie.frames, movie.cycles, digest = \
+                        END.unpack_from(data, offset)
+                    movie.state_hash = digest.hex()
+                    return movie
+                else:
+                    raise Exception("unknown chunk " + repr(tag))
+        except (struct.error, zlib.error) as e:
+            raise Exception("broken movie: " + str(e))
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as f:
+            return Movie.from_bytes(f.read())
+
+
+class MovieRecorder:
+
+    def __init__(self, interpreter, scheduler, game_file,
+                 keyframe_interval=120):
+        self.interpreter = interpreter
+        self.scheduler = scheduler
+        self.game_file = game_file
+        self.keyframe_interval = keyframe_interval
+        self.movie = None
+        self._controller = None
+        self._keys = 0
+        self._frames = 0
+        self._start_cycle = 0
+
+    @property
+    def recording(self):
+        return self.movie is not None
+
+    def get_key_code(self):
+        return lowest_key(self._keys)
+
+    def is_pressed(self, key):
+        return self._keys >> key & 1 == 1
+
+    def apply_events(self, until=None):
+        self._controller.apply_events(until)
+
+    def start(self):
+        if self.recording:
+            raise Exception("movie is already being recorded")
+        self.movie = Movie(rom_hash(self.game_file),
+                           self.scheduler.instructions_per_frame,
+                           self.keyframe_interval)
+        self._controller = self.interpreter.controller
+        self._keys = self._controller.pressed
+        self._frames = 0
+        self._start_cycle = self.scheduler.cycles
+        self.interpreter.controller = self
+        self._add_keyframe(0)
+        self.scheduler.frame_listeners.append(self._end_frame)
+
+    def stop(self):
+        if not self.recording:
+            raise Exception("no movie is being recorded")
+        self.scheduler.frame_listeners.remove(self._end_frame)
+        self.interpreter.controller = self._controller
+        movie = self.movie
+        movie.frames = self._frames
+        movie.cycles = self.scheduler.cycles - self._start_cycle
+        movie.state_hash = state_hash(self.interpreter)
+        self.movie = None
+        return movie
+
+    def _add_keyframe(self, cycle):
+        self.movie.keyframes.append(
+            Keyframe(self._frames, cycle, self._keys,
+                     self.interpreter.serialize_state()))
+
+    def _end_frame(self):
+        self._frames += 1
+        cycle = self.scheduler.cycles - self._start_cycle
+        keys = self._controller.pressed
+        if keys != self._keys:
+            self._keys = keys
+            self.movie.events.append((cycle, keys))
+        if self._frames % self.keyframe_interval == 0:
+            self._add_keyframe(cycle)
+
+
+class MoviePlayer:
+
+    def __init__(self, movie, game_file, sprites, use_translator=False):
+        if rom_hash(game_file) != movie.rom_hash:
+            raise Exception("movie was not recorded with " + game_file)
+        self.movie = movie
+        self.runner = HeadlessRunner(game_file, sprites,
+                                     movie.cycles_per_frame, use_translator)
+        self.frame = 0
+        self.cycle = 0
+        self.seek(0)
+
+    @property
+    def finished(self):
+        return self.frame >= self.movie.frames
+
+    def seek(self, frame):
+        frame = min(frame, self.movie.frames)
+        keyframe = self.movie.keyframe_before(frame)
+        self.runner.interpreter.load_state(keyframe.state)
+        self.runner.controller.set_keys(keyframe.keys)
+        self.frame = keyframe.frame
+        self.cycle = keyframe.cycle
+        return self.run_to(frame)
+
+    def run_to(self, frame, record_frames=False):
+        frame = min(frame, self.movie.frames)
+        cycles = min(frame * self.movie.cycles_per_frame,
+                     self.movie.cycles) - self.cycle
+        events = [(cycle - self.cycle, keys)
+                  for cycle, keys in self.movie.events if cycle >= self.cycle]
+        result = self.runner.run(max(cycles, 0), events, record_frames,
+                                 key_masks=True)
+        self.frame = max(frame, self.frame)
+        self.cycle += result.instructions
+        return result
+
+    def state_hash(self):
+        return state_hash(self.runner.interpreter)
+
+    def frame_hash(self):
+        return frame_hash(self.runner.interpreter)
+
+
+def run(args):
+    movie = Movie.load(args.movie)
+    player = MoviePlayer(movie, args.rom, load_sprites(args.sprites),
+                         args.translate)
+    if args.seek:
+        player.seek(args.seek)
+    end = movie.frames if args.frames is None else player.frame + args.frames
+    result = player.run_to(end, args.frame_hashes)
+    for frame_number, frame in enumerate(result.frame_hashes,
+                                         end - len(result.frame_hashes) + 1):
+        print("frame", frame_number, frame)
+    print("frames:", player.frame)
+    print("instructions:", result.instructions)
+    print("seconds: {0:.3f}".format(result.seconds))
+    print("instructions/sec: {0:.0f}".format(result.instructions_per_second))
+    print("state hash:", result.state_hash)
+    if player.finished:
+        matches = result.state_hash == movie.state_hash
+        print("matches recording:", "yes" if matches else "no")
+        return 0 if matches else 1
+    return 0
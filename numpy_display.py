@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+from display import Display, dirty_row_spans
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+class NumpyDisplay:
+
+    WIDTH = Display.WIDTH
+    HEIGHT = Display.HEIGHT
+
+    def __init__(self):
+        if numpy is None:
+            raise Exception("NumpyDisplay requires NumPy")
+        self._pixels = numpy.zeros((self.HEIGHT, self.WIDTH),
+                                   dtype=numpy.uint8)
+        self._dirty_rows = 0
+
+    @property
+    def frame(self):
+        return self._pixels
+
+    def set_pixel(self, point, value):
+        point = Display.get_correct_point(point)
+        self._pixels[point.y, point.x] = 1 if value else 0
+        self._dirty_rows |= 1 << point.y
+
+    def get_pixel(self, point):
+        point = Display.get_correct_point(point)
+        return int(self._pixels[point.y, point.x])
+
+    def get_row(self, y):
+        return int.from_bytes(numpy.packbits(self._pixels[y]).tobytes(),
+                              'big')
+
+    def draw_sprite(self, x, y, sprite):
+        x %= self.WIDTH
+        y %= self.HEIGHT
+        bits = numpy.unpackbits(numpy.frombuffer(bytes(sprite),
+                                                 dtype=numpy.uint8))
+        bits = bits.reshape(-1, 8)
+        height = len(bits)
+        for line, byte in enumerate(sprite):
+            if byte:
+                self._dirty_rows |= 1 << (y + line) % self.HEIGHT
+        if x + 8 <= self.WIDTH and y + height <= self.HEIGHT:
+            region = self._pixels[y:y + height, x:x + 8]
+            collision = (region & bits).any()
+            region ^= bits
+        else:
+            rows = (y + numpy.arange(height)) % self.HEIGHT
+            columns = (x + numpy.arange(8)) % self.WIDTH
+            index = numpy.ix_(rows, columns)
+            region = self._pixels[index]
+            collision = (region & bits).any()
+            self._pixels[index] = region ^ bits
+        return bool(collision)
+
+    def to_bytes(self):
+        return numpy.packbits(self._pixels, axis=1).tobytes()
+
+    def load_bytes(self, data):
+        frame = numpy.frombuffer(bytes(data), dtype=numpy.uint8)
+        self._pixels[:] = numpy.unpackbits(frame).reshape(self.HEIGHT,
+                                                          self.WIDTH)
+        self._dirty_rows = (1 << self.HEIGHT) - 1
+
+    def clear(self):
+        for row_number in numpy.flatnonzero(self._pixels.any(axis=1)):
+            self._dirty_rows |= 1 << int(row_number)
+        self._pixels.fill(0)
+
+    def take_dirty_rows(self):
+        dirty_rows = self._dirty_rows
+        self._dirty_rows = 0
+        return dirty_row_spans(dirty_rows)
+
+
+DISPLAYS = {"python": Display, "numpy": NumpyDisplay}
+
+
+def display_class(name):
+    if name == "numpy" and numpy is None:
+        raise Exception("--display numpy requires NumPy")
+    return DISPLAYS[name]
@@ -0,0 +1,296 @@
+#!/usr/bin/python3
+
+MAX_IDLE_LOOP = 4
+
+
+class IdleLoop(Exception):
+
+    def __init__(self, length):
+        super().__init__(length)
+        self.length = length
+
+
+def clear(interpreter, x, y, value):
+    interpreter.display.clear()
+
+
+def return_(interpreter, x, y, value):
+    interpreter.instruction_pointer = interpreter.stack.pop()
+
+
+def jump(interpreter, x, y, address):
+    interpreter.instruction_pointer = address
+
+
+def _code_at(interpreter, address):
+    memory = interpreter.memory
+    return memory.get_value(address) << 8 | memory.get_value(address + 1)
+
+
+def idle_loop_length(interpreter, start, jump_address):
+    if start == jump_address:
+        return 1
+    V = interpreter.registers
+    first = _code_at(interpreter, start)
+    x = (first & 0x0f00) >> 8
+    if jump_address == start + 2 and first & 0xf0ff in (0xe09e, 0xe0a1):
+        pushed = interpreter.is_key_pressed(V[x])
+        if pushed == (first & 0xff == 0x9e):
+            return 0
+        return 2
+    if jump_address == start + 4 and first & 0xf0ff == 0xf007:
+        second = _code_at(interpreter, start + 2)
+        ticks = interpreter.delay_timer.ticks
+        if second >> 12 not in (0x3, 0x4) or \
+                (second & 0x0f00) >> 8 != x or V[x] != ticks:
+            return 0
+        if (ticks == second & 0xff) == (second >> 12 == 0x3):
+            return 0
+        return 3
+    return 0
+
+
+def idle_jump(interpreter, x, y, address):
+    jump_address = interpreter.instruction_pointer - 2
+    interpreter.instruction_pointer = address
+    if interpreter.skip_idle_loops:
+        length = idle_loop_length(interpreter, address, jump_address)
+        if length:
+            raise IdleLoop(length)
+
+
+def may_be_idle_jump(address, target):
+    return 0 <= address - target <= MAX_IDLE_LOOP
+
+
+def call(interpreter, x, y, address):
+    interpreter.stack.push(interpreter.instruction_pointer)
+    interpreter.instruction_pointer = address
+
+
+def pass_if_equal(interpreter, x, y, value):
+    if interpreter.registers[x] == value:
+        interpreter.instruction_pointer += 2
+
+
+def pass_if_not_equal(interpreter, x, y, value):
+    if interpreter.registers[x] != value:
+        interpreter.instruction_pointer += 2
+
+
+def pass_if_registers_equal(interpreter, x, y, value):
+    V = interpreter.registers
+    if V[x] == V[y]:
+        interpreter.instruction_pointer += 2
+
+
+def pass_if_registers_not_equal(interpreter, x, y, value):
+    V = interpreter.registers
+    if V[x] != V[y]:
+        interpreter.instruction_pointer += 2
+
+
+def move(interpreter, x, y, value):
+    interpreter.registers[x] = value
+
+
+def add_value(interpreter, x, y, value):
+    V = interpreter.registers
+    V[x] = (V[x] + value) & 0xff
+
+
+def move_register(interpreter, x, y, value):
+    V = interpreter.registers
+    V[x] = V[y]
+
+
+def or_(interpreter, x, y, value):
+    V = interpreter.registers
+    V[x] |= V[y]
+
+
+def and_(interpreter, x, y, value):
+    V = interpreter.registers
+    V[x] &= V[y]
+
+
+def xor(interpreter, x, y, value):
+    V = interpreter.registers
+    V[x] ^= V[y]
+
+
+def add(interpreter, x, y, value):
+    V = interpreter.registers
+    value = V[y]
+    V[0xf] = V[x] + value > 0xff
+    V[x] = (V[x] + value) & 0xff
+
+
+def sub(interpreter, x, y, value):
+    V = interpreter.registers
+    value = V[y]
+    V[0xf] = V[x] > value
+    V[x] = (V[x] - value) & 0xff
+
+
+def shift_right(interpreter, x, y, value):
+    V = interpreter.registers
+    V[0xf] = V[x] & 1
+    V[x] >>= 1
+
+
+def sub_n(interpreter, x, y, value):
+    V = interpreter.registers
+    value = V[y]
+    V[0xf] = value > V[x]
+    V[x] = (value - V[x]) & 0xff
+
+
+def shift_left(interpreter, x, y, value):
+    V = interpreter.registers
+    V[0xf] = V[x] >> 7
+    V[x] = (V[x] << 1) & 0xff
+
+
+def move_to_index(interpreter, x, y, address):
+    interpreter.index = address
+
+
+def jump_with_offset(interpreter, x, y, address):
+    interpreter.instruction_pointer = address + interpreter.registers[0]
+
+
+def random_(interpreter, x, y, value):
+    interpreter.registers[x] = interpreter.random.next_byte() & value
+
+
+def draw(interpreter, x, y, lines):
+    V = interpreter.registers
+    draw_sprite(interpreter, V[x], V[y], lines)
+
+
+def draw_sprite(interpreter, x, y, lines):
+    interpreter.need_redraw = True
+    sprite = interpreter.memory.view(interpreter.index, lines)
+    interpreter.registers[0xf] = \
+        interpreter.display.draw_sprite(x, y, sprite)
+
+
+def check_pushed(interpreter, x, y, value):
+    if interpreter.is_key_pressed(interpreter.registers[x]):
+        interpreter.instruction_pointer += 2
+
+
+def check_not_pushed(interpreter, x, y, value):
+    if not interpreter.is_key_pressed(interpreter.registers[x]):
+        interpreter.instruction_pointer += 2
+
+
+def move_delay_timer(interpreter, x, y, value):
+    interpreter.registers[x] = interpreter.delay_timer.ticks
+
+
+def wait_pushing(interpreter, x, y, value):
+    key_code = interpreter.get_key_code()
+    if key_code is None:
+        interpreter.instruction_pointer -= 2
+        interpreter.waiting_for_key = True
+        if interpreter.skip_idle_loops:
+            raise IdleLoop(1)
+    else:
+        interpreter.registers[x] = key_code
+        interpreter.waiting_for_key = False
+
+
+def set_delay_timer(interpreter, x, y, value):
+    interpreter.delay_timer.ticks = interpreter.registers[x]
+
+
+def set_sound_timer(interpreter, x, y, value):
+    interpreter.sound_timer.ticks = interpreter.registers[x]
+
+
+def add_to_index(interpreter, x, y, value):
+    interpreter.index = (interpreter.index + interpreter.registers[x]) & \
+        0xffff
+
+
+def set_symbol_location(interpreter, x, y, value):
+    interpreter.index = interpreter.registers[x] * 5
+
+
+def store_decimal_to_memory(interpreter, x, y, value):
+    value = interpreter.registers[x]
+    address = interpreter.index
+    decimal = bytes((value // 100, value // 10 % 10, value % 10))
+    interpreter.memory.load(address, decimal)
+    interpreter.invalidate_code(address, 3)
+
+
+def store_registers(interpreter, x, y, value):
+    address = interpreter.index
+    interpreter.memory.load(address, interpreter.registers[:x + 1])
+    interpreter.invalidate_code(address, x + 1)
+
+
+def load_registers(interpreter, x, y, value):
+    interpreter.registers[:x + 1] = \
+        interpreter.memory.view(interpreter.index, x + 1)
+
+
+SYSTEM = {0xe0: clear,
+          0xee: return_}
+
+ARITHMETIC = {0x0: move_register,
+              0x1: or_,
+              0x2: and_,
+              0x3: xor,
+              0x4: add,
+              0x5: sub,
+              0x6: shift_right,
+              0x7: sub_n,
+              0xe: shift_left}
+
+KEYBOARD = {0x9e: check_pushed,
+            0xa1: check_not_pushed}
+
+MISCELLANEOUS = {0x07: move_delay_timer,
+                 0x0a: wait_pushing,
+                 0x15: set_delay_timer,
+                 0x18: set_sound_timer,
+                 0x1e: add_to_index,
+                 0x29: set_symbol_location,
+                 0x33: store_decimal_to_memory,
+                 0x55: store_registers,
+                 0x65: load_registers}
+
+# Each entry is either a handler taking the 12-bit address, the 8-bit
+# value or the 4-bit nibble as its last operand, or a (sub-table, field)
+# pair selecting the handler by the low byte or the low nibble.
+TABLE = [(SYSTEM, 'kk'),
+         (jump, 'nnn'),
+         (call, 'nnn'),
+         (pass_if_equal, 'kk'),
+         (pass_if_not_equal, 'kk'),
+         ({0x0: pass_if_registers_equal}, 'n'),
+         (move, 'kk'),
+         (add_value, 'kk'),
+         (ARITHMETIC, 'n'),
+         ({0x0: pass_if_registers_not_equal}, 'n'),
+         (move_to_index, 'nnn'),
+         (jump_with_offset, 'nnn'),
+         (random_, 'kk'),
+         (draw, 'n'),
+         (KEYBOARD, 'kk'),
+         (MISCELLANEOUS, 'kk')]
+
+
+def predecode(code):
+    fields = {'n': code & 0x000f, 'kk': code & 0x00ff, 'nnn': code & 0x0fff}
+    handler, field = TABLE[code >> 12]
+    value = fields[field]
+    if type(handler) is dict:
+        if value not in handler or code >> 12 == 0x0 and code & 0x0f00:
+            raise Exception("Wrong command code: " + hex(code))
+        handler = handler[value]
+    return handler, (code & 0x0f00) >> 8, (code & 0x00f0) >> 4, value
@@ -0,0 +1,113 @@
+#!/usr/bin/python3
+
+import json
+import time
+
+
+class Profiler:
+
+    def __init__(self):
+        self.address_counts = [0] * 4096
+        self.handler_counts = {}
+        self.handler_times = {}
+        self.families = {}
+        self.frames = 0
+        self.started = time.perf_counter()
+        self.stopped = None
+
+    def record(self, address, handler, seconds):
+        self.address_counts[address] += 1
+        self.handler_counts[handler] = self.handler_counts.get(handler, 0) + 1
+        self.handler_times[handler] = \
+            self.handler_times.get(handler, 0) + seconds
+
+    def end_frame(self):
+        self.frames += 1
+
+    def stop(self):
+        self.stopped = time.perf_counter()
+
+    @property
+    def instructions(self):
+        return sum(self.handler_counts.values())
+
+    @property
+    def seconds(self):
+        end = self.stopped if self.stopped is not None else \
+            time.perf_counter()
+        return end - self.started
+
+    @property
+    def instructions_per_second(self):
+        seconds = self.seconds
+        if seconds == 0:
+            return 0
+        return self.instructions / seconds
+
+    @property
+    def frames_per_second(self):
+        seconds = self.seconds
+        if seconds == 0:
+            return 0
+        return self.frames / seconds
+
+    def family_stats(self):
+        stats = {}
+        for handler, count in list(self.handler_counts.items()):
+            family = self.families.get(handler, handler.__name__)
+            family_count, family_seconds = stats.get(family, (0, 0))
+            stats[family] = (family_count + count,
+                             family_seconds +
+                             self.handler_times.get(handler, 0))
+        return sorted(stats.items(), key=lambda item: -item[1][0])
+
+    def handler_stats(self):
+        return sorted(((handler.__name__, count,
+                        self.handler_times.get(handler, 0))
+                       for handler, count
+                       in list(self.handler_counts.items())),
+                      key=lambda item: -item[1])
+
+    def hot_addresses(self, limit=16):
+        addresses = [(address, count)
+                     for address, count in enumerate(self.address_counts)
+                     if count]
+        addresses.sort(key=lambda item: -item[1])
+        return addresses[:limit]
+
+    def to_dict(self):
+        return {'instructions': self.instructions,
+                'seconds': self.seconds,
+                'instructions_per_second': self.instructions_per_second,
+                'frames': self.frames,
+                'frames_per_second': self.frames_per_second,
+                'families': {family: {'count': count, 'seconds': seconds}
+                             for family, (count, seconds)
+                             in self.family_stats()},
+                'handlers': {name: {'count': count, 'seconds': seconds}
+                             for name, count, seconds
+                             in self.handler_stats()},
+                'addresses': {hex(address): count
+                              for address, count
+                              in enumerate(self.address_counts) if count}}
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def format(self, limit=16):
+        total = max(self.instructions, 1)
+        lines = ["instructions: {0}  {1:.0f}/s  frames: {2}  {3:.1f}/s"
+                 .format(self.instructions, self.instructions_per_second,
+                         self.frames, self.frames_per_second),
+                 "",
+                 "{0:<22}{1:>10}{2:>8}{3:>12}".format("family", "count",
+                                                      "%", "us/op")]
+        for family, (count, seconds) in self.family_stats()[:limit]:
+            lines.append("{0:<22}{1:>10}{2:>8.1f}{3:>12.2f}".format(
+                family, count, 100 * count / total, 1e6 * seconds / count))
+        lines += ["", "{0:<22}{1:>10}{2:>8}".format("address", "count", "%")]
+        for address, count in self.hot_addresses(limit):
+            lines.append("{0:<22}{1:>10}{2:>8.1f}".format(
+                "0x{0:03x}".format(address), count, 100 * count / total))
+        return "\n".join(lines)
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+import collections
+import zlib
+
+
+def _xor(first, second):
+    return (int.from_bytes(first, 'big') ^
+            int.from_bytes(second, 'big')).to_bytes(len(first), 'big')
+
+
+class _Segment:
+
+    def __init__(self, keyframe):
+        self.keyframe = keyframe
+        self.deltas = []
+        self.size = len(keyframe)
+
+    def add(self, state):
+        delta = zlib.compress(_xor(state, self.keyframe), 1)
+        self.deltas.append(delta)
+        self.size += len(delta)
+
+    def pop(self):
+        if not self.deltas:
+            return self.keyframe
+        delta = self.deltas.pop()
+        self.size -= len(delta)
+        return _xor(zlib.decompress(delta), self.keyframe)
+
+
+class RewindBuffer:
+
+    def __init__(self, size_limit=4 * 1024 * 1024, interval=1,
+                 keyframe_interval=120):
+        self.size_limit = size_limit
+        self.interval = interval
+        self.keyframe_interval = keyframe_interval
+        self._segments = collections.deque()
+        self._size = 0
+        self._frames = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def __len__(self):
+        return sum(len(segment.deltas) + 1 for segment in self._segments)
+
+    def clear(self):
+        self._segments.clear()
+        self._size = 0
+        self._frames = 0
+
+    def capture(self, interpreter):
+        self._frames += 1
+        if self._frames % self.interval == 0:
+            self.push(interpreter.serialize_state())
+
+    def push(self, state):
+        if not self._segments or \
+                len(self._segments[-1].deltas) >= self.keyframe_interval:
+            segment = _Segment(state)
+            self._segments.append(segment)
+            self._size += segment.size
+        else:
+            segment = self._segments[-1]
+            old_size = segment.size
+            segment.add(state)
+            self._size += segment.size - old_size
+        while self._size > self.size_limit and len(self._segments) > 1:
+            self._size -= self._segments.popleft().size
+
+    def pop(self):
+        if not self._segments:
+            return None
+        segment = self._segments[-1]
+        old_size = segment.size
+        state = segment.pop()
+        if state is segment.keyframe:
+            self._segments.pop()
+            self._size -= old_size
+        else:
+            self._size += segment.size - old_size
+        return state
+
+    def step_back(self, interpreter):
+        state = self.pop()
+        if state is not None and state == interpreter.serialize_state():
+            state = self.pop()
+        if state is None:
+            return False
+        interpreter.load_state(state)
+        return True
@@ -0,0 +1,30 @@
+#!/usr/bin/python3
+
+import os
+
+
+class XorShiftRandom:
+
+    def __init__(self, seed=None):
+        self.seed(seed)
+
+    @property
+    def state(self):
+        return self._state
+
+    @state.setter
+    def state(self, value):
+        self._state = value & 0xffffffff or 1
+
+    def seed(self, value=None):
+        if value is None:
+            value = int.from_bytes(os.urandom(4), 'big')
+        self.state = value
+
+    def next_byte(self):
+        x = self._state
+        x ^= x << 13 & 0xffffffff
+        x ^= x >> 17
+        x ^= x << 5 & 0xffffffff
+        self._state = x
+        return x >> 24
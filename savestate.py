@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+
+import io
+import pickle
+import struct
+
+MAGIC = b'CH8S'
+VERSION = 2
+
+HEADER = struct.Struct('>4sH')
+BODIES = {1: struct.Struct('>4096s16sHHB16HHH256s'),
+          2: struct.Struct('>4096s16sHHB16HHH256sI')}
+BODY = BODIES[VERSION]
+SIZE = HEADER.size + BODY.size
+
+STACK_SIZE = 16
+
+
+class SaveState:
+
+    def __init__(self, memory, registers, index, instruction_pointer, stack,
+                 delay_timer, sound_timer, frame, random_state=None):
+        self.memory = bytes(memory)
+        self.registers = bytes(registers)
+        self.index = index
+        self.instruction_pointer = instruction_pointer
+        self.stack = list(stack)
+        self.delay_timer = delay_timer
+        self.sound_timer = sound_timer
+        self.frame = bytes(frame)
+        self.random_state = random_state
+
+    @staticmethod
+    def from_interpreter(interpreter):
+        return SaveState(interpreter.memory.view(0, 4096),
+                         interpreter.registers,
+                         interpreter.index,
+                         interpreter.instruction_pointer,
+                         interpreter.stack.items,
+                         interpreter.delay_timer.ticks,
+                         interpreter.sound_timer.ticks,
+                         interpreter.display.to_bytes(),
+                         interpreter.random.state)
+
+    def apply(self, interpreter):
+        interpreter.registers[:] = self.registers
+        interpreter.index = self.index
+        interpreter.instruction_pointer = self.instruction_pointer
+        interpreter.memory.load(0, self.memory)
+        interpreter.invalidate_code(0, 4096)
+        interpreter.stack.load(self.stack)
+        interpreter.delay_timer.ticks = self.delay_timer
+        interpreter.sound_timer.ticks = self.sound_timer
+        interpreter.display.load_bytes(self.frame)
+        if self.random_state is not None:
+            interpreter.random.state = self.random_state
+        interpreter.waiting_for_key = False
+        interpreter.need_redraw = True
+
+    def to_bytes(self):
+        stack = self.stack + [0] * (STACK_SIZE - len(self.stack))
+        return HEADER.pack(MAGIC, VERSION) + \
+            BODY.pack(self.memory, self.registers, self.index,
+                      self.instruction_pointer, len(self.stack), *stack,
+                      self.delay_timer, self.sound_timer, self.frame,
+                      self.random_state or 0)
+
+    @staticmethod
+    def from_bytes(data):
+        if len(data) < HEADER.size:
+            raise Exception("savestate is too short")
+        magic, version = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise Exception("not a CHIP-8 savestate")
+        if version not in BODIES:
+            raise Exception("unsupported savestate version " + str(version))
+        body = BODIES[version]
+        if len(data) != HEADER.size + body.size:
+            raise Exception("savestate version " + str(version) +
+                            " must be " + str(HEADER.size + body.size) +
+                            " bytes, got " + str(len(data)))
+        memory, registers, index, instruction_pointer, stack_pointer, \
+            *rest = body.unpack_from(data, HEADER.size)
+        stack = rest[:STACK_SIZE]
+        delay_timer, sound_timer, frame, *random_state = rest[STACK_SIZE:]
+        if stack_pointer >= STACK_SIZE:
+            raise Exception("savestate stack pointer is out of range")
+        if delay_timer > 0xff or sound_timer > 0xff:
+            raise Exception("savestate timer is out of range")
+        return SaveState(memory, registers, index & 0xffff,
+                         instruction_pointer & 0xfff,
+                         [address & 0xfff
+                          for address in stack[:stack_pointer]],
+                         delay_timer, sound_timer, frame,
+                         random_state[0] if random_state else None)
+
+
+class _LegacyObject:
+    pass
+
+
+def _legacy_function(*args):
+    return None
+
+
+class _LegacyUnpickler(pickle.Unpickler):
+
+    OBJECTS = {('interpreter', 'Interpreter'), ('memory', 'Memory'),
+               ('memory', 'Register'), ('memory', 'Stack'),
+               ('display', 'Display'), ('display', 'Point'),
+               ('timer', 'Timer'), ('controller', 'Controller'),
+               ('PyQt5.QtMultimedia', 'QSound')}
+
+    FUNCTIONS = {('timer', 'empty_func'), ('builtins', 'getattr')}
+
+    def find_class(self, module, name):
+        if (module, name) in self.OBJECTS:
+            return _LegacyObject
+        if (module, name) in self.FUNCTIONS:
+            return _legacy_function
+        if (module, name) == ('builtins', 'bytearray'):
+            return bytearray
+        raise Exception("savestate refers to forbidden " + module + "." +
+                        name)
+
+
+def _legacy_frame(pixels):
+    rows = [0] * 32
+    if isinstance(pixels, dict):
+        for point, value in pixels.items():
+            if value:
+                rows[point._y % 32] |= 1 << (63 - point._x % 64)
+    else:
+        rows = list(pixels)
+    return b''.join(row.to_bytes(8, 'big') for row in rows)
+
+
+def decode_legacy(data):
+    try:
+        interpreter = _LegacyUnpickler(io.BytesIO(data)).load()
+        stack = interpreter.stack
+        state = SaveState(bytes(interpreter.memory._memory),
+                          bytes(register._value % 256
+                                for register in interpreter.V),
+                          interpreter.I._value % 0x10000,
+                          interpreter.instruction_pointer & 0xfff,
+                          stack._memory[:stack._stack_pointer],
+                          interpreter.delay_timer._ticks,
+                          interpreter.sound_timer._ticks,
+                          _legacy_frame(interpreter.display._pixels))
+        if len(state.memory) != 4096:
+            raise Exception("memory is not 4096 bytes")
+        return SaveState.from_bytes(state.to_bytes())
+    except Exception as e:
+        raise Exception("broken legacy savestate: " + str(e))
+
+
+def decode(data):
+    if data[:len(MAGIC)] == MAGIC:
+        return SaveState.from_bytes(data)
+    return decode_legacy(data)
@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+import time
+
+import opcodes
+import timer
+from translator import BlockTranslator
+
+
+def instructions_per_frame_for_speed(speed):
+    return max(1, round(10 * 2 ** ((speed - 85) / 5)))
+
+
+class Scheduler:
+
+    FRAME_RATE = 60
+    FRAME_INTERVAL = 1000 // FRAME_RATE
+    FRAME_DURATION = 1 / FRAME_RATE
+    MAX_SKIPPED_FRAMES = 5
+    TURBO_SLICE = FRAME_DURATION / 2
+    TURBO_PRESENT_INTERVAL = 8
+
+    def __init__(self, interpreter, instructions_per_frame=10,
+                 present_func=timer.empty_func, use_translator=False,
+                 frame_skip=True):
+        self.interpreter = interpreter
+        self.instructions_per_frame = instructions_per_frame
+        self.present_func = present_func
+        self.frame_skip = frame_skip
+        self.frames = 0
+        self.cycles = 0
+        self.presented_frames = 0
+        self.skipped_frames = 0
+        self.frame_listeners = []
+        self.turbo = False
+        self.turbo_multiplier = None
+        self.turbo_frame_limit = None
+        self.turbo_frames = 0
+        self.present_interval = 1
+        self.input_deadline = None
+        self._next_frame_time = None
+        if use_translator:
+            self._fast_execute = BlockTranslator(interpreter).run
+        else:
+            self._fast_execute = self._execute_commands
+        self._execute = self._fast_execute
+
+    @property
+    def waiting(self):
+        return self.interpreter.waiting_for_key and \
+            self.interpreter.get_key_code() is None
+
+    def execute(self, cycles):
+        if self.waiting:
+            executed = cycles
+        else:
+            executed = self._execute(cycles)
+        self.cycles += executed
+        return executed
+
+    def _execute_commands(self, cycles):
+        interpreter = self.interpreter
+        execute_next_command = interpreter.execute_next_command
+        executed = 0
+        interpreter.skip_idle_loops = True
+        try:
+            for executed in range(1, cycles + 1):
+                execute_next_command()
+        except opcodes.IdleLoop as loop:
+            interpreter.skip_idle_loops = False
+            interpreter.finish_idle_loop(loop.length, cycles - executed)
+        finally:
+            interpreter.skip_idle_loops = False
+        return cycles
+
+    def start_profiling(self, profiler=None):
+        profiler = self.interpreter.start_profiling(profiler)
+        self._execute = self._execute_commands
+        self.frame_listeners.append(profiler.end_frame)
+        return profiler
+
+    def stop_profiling(self):
+        profiler = self.interpreter.stop_profiling()
+        self.frame_listeners.remove(profiler.end_frame)
+        self._execute = self._fast_execute
+        return profiler
+
+    def end_frame(self, present=True):
+        self.interpreter.delay_timer.tick()
+        self.interpreter.sound_timer.tick()
+        self.frames += 1
+        self.interpreter.controller.apply_events(self.input_deadline)
+        for listener in self.frame_listeners:
+            listener()
+        if self.interpreter.need_redraw:
+            if present:
+                self.interpreter.need_redraw = False
+                self.presented_frames += 1
+                self.present_func()
+            else:
+                self.skipped_frames += 1
+
+    def run_frame(self, present=True):
+        executed = self.execute(self.instructions_per_frame)
+        self.end_frame(present)
+        return executed
+
+    def start_turbo(self, multiplier=None, frames=None,
+                    present_interval=TURBO_PRESENT_INTERVAL):
+        self.turbo = True
+        self.turbo_multiplier = multiplier
+        self.turbo_frame_limit = frames
+        self.turbo_frames = 0
+        self.present_interval = present_interval
+        self.interpreter.muted = True
+        self._next_frame_time = None
+
+    def stop_turbo(self):
+        self.turbo = False
+        self.interpreter.muted = False
+        self._next_frame_time = None
+
+    def _run_turbo_frame(self):
+        self.turbo_frames += 1
+        self.run_frame(present=self.turbo_frames % self.present_interval == 0)
+        if self.turbo_frames == self.turbo_frame_limit:
+            self.stop_turbo()
+
+    def _run_uncapped_frames(self):
+        deadline = time.perf_counter() + self.TURBO_SLICE
+        due = 0
+        while self.turbo and (due == 0 or time.perf_counter() < deadline):
+            self._run_turbo_frame()
+            due += 1
+        return due
+
+    def time_until_next_frame(self, now=None):
+        if self.turbo and self.turbo_multiplier is None or \
+                self._next_frame_time is None:
+            return 0
+        if now is None:
+            now = time.perf_counter()
+        return max(0, self._next_frame_time - now)
+
+    def run_due_frames(self, now=None):
+        if self.turbo and self.turbo_multiplier is None:
+            return self._run_uncapped_frames()
+        multiplier = self.turbo_multiplier if self.turbo else 1
+        duration = self.FRAME_DURATION / multiplier
+        if now is None:
+            now = time.perf_counter()
+        if self._next_frame_time is None:
+            self._next_frame_time = now
+        first_frame_time = self._next_frame_time
+        due = 0
+        while self._next_frame_time <= now and \
+                due <= self.MAX_SKIPPED_FRAMES * multiplier:
+            self._next_frame_time += duration
+            due += 1
+        if self._next_frame_time <= now:
+            self._next_frame_time = now + duration
+        turbo = self.turbo
+        if not turbo and not self.frame_skip:
+            due = min(due, 1)
+        try:
+            for frame in range(due):
+                self.input_deadline = min(
+                    first_frame_time + (frame + 1) * duration, now)
+                if not turbo:
+                    self.run_frame(present=frame == due - 1)
+                elif not self.turbo:
+                    return frame
+                else:
+                    self._run_turbo_frame()
+        finally:
+            self.input_deadline = None
+        return due
@@ -0,0 +1,191 @@
+#!/usr/bin/python3
+
+import asyncio
+import hashlib
+import struct
+
+from display import Display
+from headless import HeadlessRunner
+from interpreter import load_sprites
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8064
+
+FRAME_TAG = b'F'
+KEY_TAG = b'K'
+NO_KEY = 0xff
+
+FRAME_HEADER = struct.Struct('>cIB')
+ROW = struct.Struct('>B8s')
+KEY = struct.Struct('>cB')
+
+
+def encode_frame(frame_number, display, rows):
+    rows = list(rows)
+    return FRAME_HEADER.pack(FRAME_TAG, frame_number, len(rows)) + \
+        b''.join(ROW.pack(row, display.get_row(row).to_bytes(8, 'big'))
+                 for row in rows)
+
+
+def encode_key(key):
+    return KEY.pack(KEY_TAG, NO_KEY if key is None else key)
+
+
+class _Client:
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.needs_full_frame = False
+
+
+class FrameServer:
+
+    MAX_BUFFERED = 64 * 1024
+
+    def __init__(self, game_file, sprites, cycles_per_frame=10,
+                 use_translator=False, seed=None, host=DEFAULT_HOST,
+                 port=DEFAULT_PORT):
+        self.runner = HeadlessRunner(game_file, sprites, cycles_per_frame,
+                                     use_translator, seed)
+        self.interpreter = self.runner.interpreter
+        self.controller = self.runner.controller
+        self.scheduler = self.runner.scheduler
+        self.scheduler.present_func = self.broadcast
+        self.host = host
+        self.port = port
+        self.clients = []
+
+    def _full_frame(self):
+        return encode_frame(self.scheduler.frames, self.interpreter.display,
+                            range(Display.HEIGHT))
+
+    def broadcast(self):
+        display = self.interpreter.display
+        rows = [row for first_row, count in display.take_dirty_rows()
+                for row in range(first_row, first_row + count)]
+        delta = encode_frame(self.scheduler.frames, display, rows)
+        full_frame = None
+        for client in self.clients:
+            transport = client.writer.transport
+            if transport.get_write_buffer_size() > self.MAX_BUFFERED:
+                client.needs_full_frame = True
+            elif client.needs_full_frame:
+                if full_frame is None:
+                    full_frame = self._full_frame()
+                client.writer.write(full_frame)
+                client.needs_full_frame = False
+            else:
+                client.writer.write(delta)
+
+    async def _handle_client(self, reader, writer):
+        client = _Client(writer)
+        self.clients.append(client)
+        writer.write(self._full_frame())
+        try:
+            while True:
+                tag, key = KEY.unpack(await reader.readexactly(KEY.size))
+                if tag != KEY_TAG:
+                    break
+                self.controller.set_key_code(None if key == NO_KEY
+                                             else key & 0xf)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.remove(client)
+            writer.close()
+
+    async def run_frames(self):
+        while True:
+            await asyncio.sleep(self.scheduler.time_until_next_frame())
+            self.scheduler.run_due_frames()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self._handle_client,
+                                                 self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve(self):
+        async with await self.start():
+            await self.run_frames()
+
+
+class FrameClient:
+
+    def __init__(self):
+        self.rows = [0] * Display.HEIGHT
+        self.frame = None
+        self._reader = None
+        self._writer = None
+
+    async def connect(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        self._reader, self._writer = await asyncio.open_connection(host,
+                                                                   port)
+
+    async def receive(self):
+        tag, frame, count = FRAME_HEADER.unpack(
+            await self._reader.readexactly(FRAME_HEADER.size))
+        if tag != FRAME_TAG:
+            raise Exception("unexpected message " + repr(tag))
+        data = await self._reader.readexactly(count * ROW.size)
+        for row, pixels in ROW.iter_unpack(data):
+            self.rows[row % Display.HEIGHT] = int.from_bytes(pixels, 'big')
+        self.frame = frame
+        return frame
+
+    def send_key(self, key):
+        self._writer.write(encode_key(key))
+
+    async def close(self):
+        self._writer.close()
+        await self._writer.wait_closed()
+
+    def to_bytes(self):
+        return b''.join(row.to_bytes(8, 'big') for row in self.rows)
+
+    def format(self):
+        return "\n".join("{0:064b}".format(row).replace('0', ' ')
+                         .replace('1', '#') for row in self.rows)
+
+
+def run(args):
+    server = FrameServer(args.rom, load_sprites(args.sprites),
+                         args.cycles_per_frame, args.translate, args.seed,
+                         args.host, args.port)
+
+    async def serve():
+        await server.start()
+        print("serving", args.rom, "on", server.host + ":" +
+              str(server.port))
+        async with server.server:
+            await server.run_frames()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def watch(args):
+    client = FrameClient()
+
+    async def receive():
+        await client.connect(args.host, args.port)
+        for key in args.key:
+            client.send_key(int(key, 16))
+        received = 0
+        while args.frames is None or received < args.frames:
+            frame = await client.receive()
+            received += 1
+            print("frame", frame,
+                  hashlib.sha1(client.to_bytes()).hexdigest())
+            if args.ascii:
+                print(client.format())
+        await client.close()
+
+    try:
+        asyncio.run(receive())
+    except KeyboardInterrupt:
+        pass
+    return 0
@@ -1,9 +1,31 @@
 #!/usr/bin/python3
 
+import asyncio
+import os
+import pickle
+import tempfile
 import unittest
+import zlib
 from interpreter import Interpreter
-from display import Point
+from controller import Controller
+from catalog import Catalog, analyze, suggest_settings
+from display import Display, Point
 from commands import Command
+from memory import Memory
+from translator import BlockTranslator
+from headless import HeadlessRunner, read_input_script, state_hash
+from batch import create_jobs, run_batch
+from scheduler import Scheduler, instructions_per_frame_for_speed
+from rewind import RewindBuffer
+from movie import Movie, MoviePlayer, MovieRecorder, EVENTS, KEYFRAMES, \
+    HEADER, END, rom_hash
+from benchmarks import bench
+from worker import EmulationThread, FrameBuffer
+from server import FrameClient, FrameServer, FRAME_HEADER, ROW, \
+    encode_frame
+import numpy_display
+import opcodes
+import savestate
 
 
 class TestCommandsDecode(unittest.TestCase):
@@ -125,6 +147,17 @@ class TestCommandsDecode(unittest.TestCase):
 
     def test_wrong_command(self):
         self.assertRaises(Exception, self.interpreter.decode, 0x0000)
+        self.assertRaises(Exception, opcodes.predecode, 0x0000)
+        self.assertRaises(Exception, opcodes.predecode, 0x5121)
+        self.assertRaises(Exception, opcodes.predecode, 0xf1ff)
+
+    def test_predecode(self):
+        self.assertEqual((opcodes.jump, 1, 0, 0x100),
+                         opcodes.predecode(0x1100))
+        self.assertEqual((opcodes.sub, 1, 2, 5), opcodes.predecode(0x8125))
+        self.assertEqual((opcodes.draw, 1, 2, 3), opcodes.predecode(0xd123))
+        self.assertEqual((opcodes.store_registers, 1, 5, 0x55),
+                         opcodes.predecode(0xf155))
 
     def check_correct_command(self, code, command, arguments):
         comm, *args = self.interpreter.decode(code)
@@ -145,6 +178,12 @@ class TestController:
     def get_key_code(self):
         return self.return_value
 
+    def is_pressed(self, key):
+        return key == self.return_value
+
+    def apply_events(self, until=None):
+        pass
+
 
 class TestExecuteCommands(unittest.TestCase):
 
@@ -391,6 +430,25 @@ class InterpreterTests(unittest.TestCase):
         self.assertEqual(0x2cd, self.interpreter.I.value)
         self.assertEqual(0x202, self.interpreter.instruction_pointer)
 
+    def test_decoded_command_cache(self):
+        self.interpreter.execute_next_command()
+        self.assertIsNotNone(self.interpreter._decoded[0x200])
+        self.interpreter.instruction_pointer = 0x200
+        self.interpreter.I.value = 0x10
+        self.interpreter.execute_next_command()
+        self.assertEqual(0x2cd, self.interpreter.I.value)
+
+    def test_decoded_command_invalidation(self):
+        self.interpreter.execute_next_command()
+        self.interpreter.V[0].value = 0x12
+        self.interpreter.V[1].value = 0x34
+        self.interpreter.I.value = 0x200
+        Command.StoreRegisters(self.interpreter).execute_command(1)
+        self.assertIsNone(self.interpreter._decoded[0x200])
+        self.interpreter.instruction_pointer = 0x200
+        self.interpreter.execute_next_command()
+        self.assertEqual(0x234, self.interpreter.instruction_pointer)
+
     def test_read_instruction(self):
         code = self.interpreter.read_instruction()
         self.assertEqual(0xa2cd, code)
@@ -424,6 +482,890 @@ class InterpreterTests(unittest.TestCase):
         self.assertEqual(self.interpreter.display._pixels,
                          new_interpreter.display._pixels)
 
+    def test_binary_savestate(self):
+        state = self.interpreter.serialize_state()
+        self.assertEqual(savestate.SIZE, len(state))
+        self.assertTrue(state.startswith(savestate.MAGIC))
+        self.assertRaises(Exception, self.interpreter.load_state, state[:-1])
+        broken = bytearray(state)
+        broken[4] = 0xff
+        self.assertRaises(Exception, self.interpreter.load_state,
+                          bytes(broken))
+
+    def test_savestate_keeps_random_state(self):
+        self.interpreter.random.seed(7)
+        state = self.interpreter.serialize_state()
+        expected = [self.interpreter.random.next_byte() for _ in range(8)]
+        self.interpreter.load_state(state)
+        self.assertEqual(expected, [self.interpreter.random.next_byte()
+                                    for _ in range(8)])
+
+    def test_load_version_1_savestate(self):
+        state = self.interpreter.serialize_state()
+        old = savestate.HEADER.pack(savestate.MAGIC, 1) + \
+            state[savestate.HEADER.size:-4]
+        random_state = self.interpreter.random.state
+        self.interpreter.load_state(old)
+        self.assertEqual(random_state, self.interpreter.random.state)
+
+    def test_register_file(self):
+        self.interpreter.V[3].value = 0x1ff
+        self.assertEqual(0xff, self.interpreter.registers[3])
+        self.interpreter.registers[4] = 7
+        self.assertEqual(7, self.interpreter.V[4].value)
+        self.interpreter.I.value = 0x1fffe
+        self.assertEqual(0xfffe, self.interpreter.index)
+        self.interpreter.registers[0xf] = 9
+        opcodes.add(self.interpreter, 0xf, 4, 0)
+        self.assertEqual(7, self.interpreter.registers[0xf])
+
+    def test_seeded_random(self):
+        first = Interpreter("games/PONG", TestController(None),
+                            InterpreterTests.correct_sprites, seed=5)
+        second = Interpreter("games/PONG", TestController(None),
+                             InterpreterTests.correct_sprites, seed=5)
+        values = [first.random.next_byte() for _ in range(16)]
+        self.assertEqual(values, [second.random.next_byte()
+                                  for _ in range(16)])
+        self.assertGreater(len(set(values)), 1)
+        first.reset("games/PONG", InterpreterTests.correct_sprites)
+        self.assertEqual(values, [first.random.next_byte()
+                                  for _ in range(16)])
+
+    def test_load_legacy_savestate(self):
+        with open("saves/UFO#2017-10-29 23:35:13", "rb") as f:
+            data = f.read()
+        self.interpreter.load_state(data[data.index(b'\n') + 1:])
+        self.assertEqual(588, self.interpreter.instruction_pointer)
+        self.assertEqual(720, self.interpreter.I.value)
+        self.assertEqual(60, self.interpreter.V[3].value)
+        self.assertEqual(0xf0, self.interpreter.memory.get_value(0))
+
+    def test_legacy_savestate_is_restricted(self):
+        state = pickle.dumps(os.getcwd)
+        self.assertRaises(Exception, self.interpreter.load_state, state)
+
+
+class DisplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.display = Display()
+
+    def test_draw_sprite(self):
+        self.assertFalse(self.display.draw_sprite(1, 2, b'\xa0\x01'))
+        self.assertEqual(1, self.display.get_pixel(Point(1, 2)))
+        self.assertEqual(0, self.display.get_pixel(Point(2, 2)))
+        self.assertEqual(1, self.display.get_pixel(Point(3, 2)))
+        self.assertEqual(1, self.display.get_pixel(Point(8, 3)))
+        self.assertTrue(self.display.draw_sprite(1, 2, b'\x80'))
+        self.assertEqual(0, self.display.get_pixel(Point(1, 2)))
+
+    def test_draw_sprite_wraparound(self):
+        self.display.draw_sprite(60, 31, b'\xff\x81')
+        for x in (60, 61, 62, 63, 0, 1, 2, 3):
+            self.assertEqual(1, self.display.get_pixel(Point(x, 31)))
+        self.assertEqual(1, self.display.get_pixel(Point(60, 0)))
+        self.assertEqual(1, self.display.get_pixel(Point(3, 0)))
+        self.assertEqual(0, self.display.get_pixel(Point(4, 31)))
+        self.assertEqual(0, self.display.get_pixel(Point(59, 31)))
+
+    def test_dirty_rows(self):
+        self.assertEqual([], self.display.take_dirty_rows())
+        self.display.draw_sprite(0, 30, b'\x01\x00\x02\x03')
+        self.assertEqual([(0, 2), (30, 1)], self.display.take_dirty_rows())
+        self.assertEqual([], self.display.take_dirty_rows())
+        self.display.set_pixel(Point(0, 5), 1)
+        self.display.take_dirty_rows()
+        self.display.clear()
+        self.assertEqual([(0, 2), (5, 1), (30, 1)],
+                         self.display.take_dirty_rows())
+
+    def test_to_bytes(self):
+        self.display.set_pixel(Point(0, 0), 1)
+        self.display.set_pixel(Point(63, 31), 1)
+        data = self.display.to_bytes()
+        self.assertEqual(256, len(data))
+        self.assertEqual(0x80, data[0])
+        self.assertEqual(0x01, data[255])
+        self.display.set_pixel(Point(0, 0), 0)
+        self.assertEqual(0, self.display.to_bytes()[0])
+
+
+@unittest.skipIf(numpy_display.numpy is None, "NumPy is not installed")
+class NumpyDisplayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.display = numpy_display.NumpyDisplay()
+        self.reference = Display()
+
+    def test_same_pixels_as_display(self):
+        sprites = [(0, 0, b'\xff\x81\x42'), (60, 30, b'\xf0\x0f\xff'),
+                   (3, 1, b'\x18\x3c'), (70, 40, b'\xaa')]
+        for x, y, sprite in sprites:
+            self.assertEqual(self.reference.draw_sprite(x, y, sprite),
+                             self.display.draw_sprite(x, y, sprite))
+        self.assertEqual(self.reference.to_bytes(), self.display.to_bytes())
+        self.assertEqual(self.reference.take_dirty_rows(),
+                         self.display.take_dirty_rows())
+        for y in range(32):
+            self.assertEqual(self.reference.get_row(y),
+                             self.display.get_row(y))
+        self.assertEqual((32, 64), self.display.frame.shape)
+
+    def test_clear(self):
+        self.display.set_pixel(Point(5, 5), 1)
+        self.assertEqual(1, self.display.get_pixel(Point(69, 37)))
+        self.display.clear()
+        self.assertEqual(0, self.display.get_pixel(Point(5, 5)))
+
+    def test_interpreter_backend(self):
+        interpreter = Interpreter("games/UFO", None, [],
+                                  display_class=numpy_display.NumpyDisplay)
+        interpreter.memory.store_value(0, 0xff)
+        Command.Draw(interpreter).execute_command(0, 0, 1)
+        self.assertEqual(1, interpreter.display.get_pixel(Point(7, 0)))
+
+    def test_headless_backend(self):
+        runners = [HeadlessRunner("games/BRIX",
+                                  InterpreterTests.correct_sprites, seed=0,
+                                  display_class=display)
+                   for display in (Display, numpy_display.display_class(
+                       "numpy"))]
+        first, second = [runner.run(2000, record_frames=True)
+                         for runner in runners]
+        self.assertIsInstance(runners[1].interpreter.display,
+                              numpy_display.NumpyDisplay)
+        self.assertEqual(first.frame_hashes, second.frame_hashes)
+        self.assertEqual(first.state_hash, second.state_hash)
+
+
+class ControllerTests(unittest.TestCase):
+
+    def test_pressed_keys(self):
+        controller = Controller()
+        self.assertIsNone(controller.get_key_code())
+        controller.set_keys(1 << 3 | 1 << 0xa)
+        self.assertTrue(controller.is_pressed(3))
+        self.assertTrue(controller.is_pressed(0xa))
+        self.assertFalse(controller.is_pressed(4))
+        self.assertFalse(controller.is_pressed(0x42))
+        self.assertEqual(3, controller.get_key_code())
+        controller.set_key_code(None)
+        self.assertEqual(0, controller.pressed)
+
+    def test_release_only_that_key(self):
+        controller = Controller()
+        controller.press(1, 1.0)
+        controller.press(2, 1.0)
+        controller.release(1, 1.0)
+        controller.apply_events()
+        self.assertEqual(1 << 1 | 1 << 2, controller.pressed)
+        controller.apply_events()
+        self.assertEqual(1 << 2, controller.pressed)
+        self.assertEqual(0, controller.pending_events)
+
+    def test_events_wait_for_their_time(self):
+        controller = Controller()
+        controller.press(5, 2.0)
+        controller.release(5, 3.0)
+        controller.apply_events(1.0)
+        self.assertEqual(0, controller.pressed)
+        controller.apply_events(2.5)
+        self.assertTrue(controller.is_pressed(5))
+        controller.apply_events(3.0)
+        self.assertFalse(controller.is_pressed(5))
+        self.assertRaises(Exception, controller.press, 16)
+
+    def test_both_pressed_keys_are_seen(self):
+        program = bytes.fromhex("e09e1200e19e12006201")
+        interpreter = Interpreter("games/BRIX", Controller(),
+                                  InterpreterTests.correct_sprites)
+        interpreter.load_commands(program)
+        interpreter.V[1].value = 7
+        interpreter.controller.set_keys(1 << 0 | 1 << 7)
+        for _ in range(3):
+            interpreter.execute_next_command()
+        self.assertEqual(1, interpreter.V[2].value)
+
+
+class MemoryTests(unittest.TestCase):
+
+    def setUp(self):
+        self.memory = Memory()
+
+    def test_masked_address(self):
+        self.memory.store_value(0x1005, 0x1ff)
+        self.assertEqual(0xff, self.memory.get_value(5))
+        self.assertEqual(0xff, self.memory.get_value(0x2005))
+
+    def test_load_and_view(self):
+        self.memory.load(0x200, b'\x01\x02\x03')
+        self.assertEqual(b'\x01\x02\x03', bytes(self.memory.view(0x200, 3)))
+        self.assertEqual(2, self.memory.get_value(0x201))
+
+    def test_load_wraparound(self):
+        self.memory.load(0xffe, b'\x01\x02\x03')
+        self.assertEqual(4096, len(self.memory._memory))
+        self.assertEqual(3, self.memory.get_value(0))
+        self.assertEqual(b'\x01\x02\x03', bytes(self.memory.view(0xffe, 3)))
+
+    def test_load_too_large(self):
+        self.assertRaises(Exception, self.memory.load, 0, bytes(4097))
+
+
+class BlockTranslatorTests(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = TestController(None)
+        self.interpreter = Interpreter("games/BRIX", self.controller,
+                                       InterpreterTests.correct_sprites)
+        self.translator = BlockTranslator(self.interpreter)
+
+    def test_same_state_as_interpreter(self):
+        reference = Interpreter("games/BRIX", self.controller,
+                                InterpreterTests.correct_sprites, seed=1)
+        self.interpreter.random.seed(1)
+        for _ in range(200):
+            for _ in range(10):
+                reference.execute_next_command()
+            reference.delay_timer.tick()
+            reference.sound_timer.tick()
+        for _ in range(200):
+            self.assertEqual(10, self.translator.run(10))
+            self.interpreter.delay_timer.tick()
+            self.interpreter.sound_timer.tick()
+
+        self.assertEqual(reference.instruction_pointer,
+                         self.interpreter.instruction_pointer)
+        self.assertEqual(reference.I.value, self.interpreter.I.value)
+        for i in range(16):
+            self.assertEqual(reference.V[i].value, self.interpreter.V[i].value)
+        self.assertEqual(reference.memory._memory,
+                         self.interpreter.memory._memory)
+        self.assertEqual(reference.display._pixels,
+                         self.interpreter.display._pixels)
+
+    def test_block_invalidation(self):
+        block = self.translator.get_block(0x200)
+        self.assertEqual(0x200, block.start)
+        self.interpreter.V[0].value = 0x12
+        self.interpreter.V[1].value = 0x00
+        self.interpreter.I.value = 0x200
+        Command.StoreRegisters(self.interpreter).execute_command(1)
+        self.assertNotEqual(block, self.translator.get_block(0x200))
+        self.translator.run(1)
+        self.assertEqual(0x200, self.interpreter.instruction_pointer)
+
+    def test_skip_inside_block(self):
+        self.interpreter.load_commands(bytes.fromhex("6001300161026203"
+                                                     "0000"))
+        self.assertEqual(0x208, self.translator.get_block(0x200).end)
+        self.assertEqual(2, self.translator.run(2))
+        self.assertEqual(0x206, self.interpreter.instruction_pointer)
+        self.assertEqual(1, self.translator.run(1))
+        self.assertEqual(0x208, self.interpreter.instruction_pointer)
+        self.assertEqual(0, self.interpreter.V[1].value)
+        self.assertEqual(3, self.interpreter.V[2].value)
+
+    def test_unchanged_block_is_reused(self):
+        block = self.translator.get_block(0x200)
+        self.interpreter.invalidate_code(0x200, 2)
+        self.assertEqual(block, self.translator.get_block(0x200))
+
+
+class IdleLoopTests(unittest.TestCase):
+
+    DELAY_LOOP = bytes.fromhex("6003f015f007300012046105f129120e")
+    KEY_LOOP = bytes.fromhex("610ae19e12026205f229120a")
+    WAIT_FOR_KEY = bytes.fromhex("6005f015f10a62071208")
+
+    def create(self, program, use_translator):
+        interpreter = Interpreter("games/PONG", TestController(None),
+                                  InterpreterTests.correct_sprites, seed=0)
+        interpreter.load_commands(program)
+        return interpreter, Scheduler(interpreter, 7,
+                                      use_translator=use_translator)
+
+    def check_same_as_stepping(self, program, use_translator, keys):
+        interpreter, scheduler = self.create(program, use_translator)
+        reference, _ = self.create(program, False)
+        skipped = []
+        original = interpreter.finish_idle_loop
+        interpreter.finish_idle_loop = \
+            lambda *args: skipped.append(args) or original(*args)
+        for key in keys:
+            interpreter.controller.return_value = key
+            reference.controller.return_value = key
+            self.assertEqual(7, scheduler.run_frame())
+            for _ in range(7):
+                reference.execute_next_command()
+            reference.delay_timer.tick()
+            reference.sound_timer.tick()
+            self.assertEqual(reference.serialize_state(),
+                             interpreter.serialize_state())
+        self.assertEqual(7 * len(keys), scheduler.cycles)
+        self.assertTrue(skipped)
+
+    def test_delay_timer_loop(self):
+        for use_translator in (False, True):
+            self.check_same_as_stepping(self.DELAY_LOOP, use_translator,
+                                        [None] * 8)
+
+    def test_key_loop(self):
+        keys = [None, None, 3, 3, 0xa, 0xa, None, None]
+        for use_translator in (False, True):
+            self.check_same_as_stepping(self.KEY_LOOP, use_translator, keys)
+
+    def test_wait_for_key(self):
+        keys = [None, None, None, 7, 7, None]
+        for use_translator in (False, True):
+            self.check_same_as_stepping(self.WAIT_FOR_KEY, use_translator,
+                                        keys)
+
+    def test_scheduler_waits_for_key(self):
+        interpreter, scheduler = self.create(self.WAIT_FOR_KEY, False)
+        scheduler.run_frame()
+        self.assertTrue(interpreter.waiting_for_key)
+        self.assertTrue(scheduler.waiting)
+        self.assertEqual(4, interpreter.delay_timer.ticks)
+        for _ in range(3):
+            scheduler.run_frame()
+        self.assertEqual(0x204, interpreter.instruction_pointer)
+        self.assertEqual(1, interpreter.delay_timer.ticks)
+        self.assertEqual(28, scheduler.cycles)
+        interpreter.controller.return_value = 9
+        self.assertFalse(scheduler.waiting)
+        scheduler.run_frame()
+        self.assertFalse(interpreter.waiting_for_key)
+        self.assertEqual(9, interpreter.V[1].value)
+        self.assertEqual(7, interpreter.V[2].value)
+
+    def test_profiling_keeps_waiting_for_key(self):
+        interpreter, scheduler = self.create(self.WAIT_FOR_KEY, False)
+        scheduler.start_profiling()
+        scheduler.run_frame()
+        scheduler.stop_profiling()
+        self.assertTrue(scheduler.waiting)
+        cycles = scheduler.cycles
+        scheduler.run_frame()
+        self.assertEqual(0x204, interpreter.instruction_pointer)
+        self.assertEqual(cycles + 7, scheduler.cycles)
+
+    def test_single_steps_are_not_skipped(self):
+        interpreter, _ = self.create(bytes.fromhex("1200"), False)
+        interpreter.execute_next_command()
+        self.assertEqual(0x200, interpreter.instruction_pointer)
+
+
+class SchedulerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.interpreter = Interpreter("games/BRIX", TestController(None),
+                                       InterpreterTests.correct_sprites)
+        self.presented = 0
+        self.scheduler = Scheduler(self.interpreter, 50, self.present)
+
+    def present(self):
+        self.presented += 1
+
+    def test_run_frame(self):
+        self.interpreter.delay_timer.ticks = 10
+        self.interpreter.sound_timer.ticks = 10
+        self.assertEqual(50, self.scheduler.run_frame())
+        self.assertEqual(9, self.interpreter.delay_timer.ticks)
+        self.assertEqual(9, self.interpreter.sound_timer.ticks)
+        self.assertEqual(1, self.scheduler.frames)
+
+    def test_present_once_per_frame(self):
+        for _ in range(20):
+            self.scheduler.run_frame()
+        self.assertGreater(self.presented, 0)
+        self.assertLessEqual(self.presented, 20)
+        self.assertFalse(self.interpreter.need_redraw)
+
+    def test_run_due_frames(self):
+        self.assertEqual(1, self.scheduler.run_due_frames(10.0))
+        self.assertEqual(0, self.scheduler.run_due_frames(10.01))
+        self.assertEqual(1, self.scheduler.run_due_frames(10.02))
+        self.assertEqual(3, self.scheduler.run_due_frames(10.07))
+        self.assertEqual(5, self.scheduler.frames)
+
+    def test_input_events_use_frame_deadlines(self):
+        controller = Controller()
+        self.interpreter.controller = controller
+        pressed = []
+        self.scheduler.frame_listeners.append(
+            lambda: pressed.append(controller.pressed))
+        self.scheduler.run_due_frames(10.0)
+        controller.press(5, 10.02)
+        controller.release(5, 10.045)
+        self.assertEqual(4, self.scheduler.run_due_frames(10.07))
+        self.assertEqual([0, 1 << 5, 0, 0, 0], pressed)
+        self.assertIsNone(self.scheduler.input_deadline)
+
+    def test_frame_skip_under_load(self):
+        self.interpreter.need_redraw = True
+        self.scheduler.run_due_frames(10.0)
+        self.interpreter.need_redraw = True
+        self.assertEqual(3, self.scheduler.run_due_frames(10.06))
+        self.assertEqual(2, self.presented)
+        self.assertGreaterEqual(self.scheduler.skipped_frames, 1)
+        self.assertEqual(self.presented, self.scheduler.presented_frames)
+        due = self.scheduler.run_due_frames(20.0)
+        self.assertEqual(Scheduler.MAX_SKIPPED_FRAMES + 1, due)
+        self.assertEqual(0, self.scheduler.run_due_frames(20.0))
+
+    def test_no_frame_skip(self):
+        self.scheduler.frame_skip = False
+        self.scheduler.run_due_frames(10.0)
+        self.assertEqual(1, self.scheduler.run_due_frames(10.06))
+
+    def test_turbo_with_multiplier(self):
+        self.interpreter.sound_timer.ticks = 1
+        self.scheduler.start_turbo(4, present_interval=2)
+        self.assertTrue(self.interpreter.muted)
+        self.assertEqual(1, self.scheduler.run_due_frames(10.0))
+        self.assertEqual(4, self.scheduler.run_due_frames(10.0167))
+        self.assertEqual(5, self.scheduler.turbo_frames)
+        self.assertLessEqual(self.presented, 2)
+        self.scheduler.stop_turbo()
+        self.assertFalse(self.interpreter.muted)
+        self.assertEqual(1, self.scheduler.run_due_frames(20.0))
+
+    def test_turbo_frame_limit(self):
+        sounds = []
+        self.interpreter.play_sound_func = lambda: sounds.append(1)
+        self.interpreter.sound_timer.ticks = 2
+        self.scheduler.start_turbo(frames=30)
+        while self.scheduler.turbo:
+            self.scheduler.run_due_frames()
+        self.assertEqual(30, self.scheduler.frames)
+        self.assertEqual([], sounds)
+        self.assertFalse(self.interpreter.muted)
+        self.interpreter.sound_timer.ticks = 1
+        self.scheduler.run_frame()
+        self.assertEqual([1], sounds)
+
+    def test_profiling(self):
+        profiler = self.scheduler.start_profiling()
+        for _ in range(4):
+            self.scheduler.run_frame()
+        self.assertIs(profiler, self.scheduler.stop_profiling())
+        self.assertEqual(200, profiler.instructions)
+        self.assertEqual(4, profiler.frames)
+        self.assertEqual(200, sum(profiler.address_counts))
+        self.assertEqual(200, sum(count for family, (count, seconds)
+                                  in profiler.family_stats()))
+        self.assertIn("Jump", dict(profiler.family_stats()))
+        self.assertNotIn("jump", dict(profiler.family_stats()))
+        self.assertEqual(1, len(profiler.hot_addresses(1)))
+        self.assertEqual(200, profiler.to_dict()['instructions'])
+        self.assertNotIn('execute_next_command', vars(self.interpreter))
+        self.scheduler.run_frame()
+        self.assertEqual(200, profiler.instructions)
+
+    def test_profiling_with_translator(self):
+        scheduler = Scheduler(self.interpreter, 50, use_translator=True)
+        profiler = scheduler.start_profiling()
+        scheduler.run_frame()
+        scheduler.stop_profiling()
+        self.assertEqual(50, profiler.instructions)
+
+    def test_instructions_per_frame_for_speed(self):
+        self.assertEqual(10, instructions_per_frame_for_speed(85))
+        self.assertEqual(1, instructions_per_frame_for_speed(0))
+        self.assertLess(instructions_per_frame_for_speed(85),
+                        instructions_per_frame_for_speed(99))
+
+
+class RewindBufferTests(unittest.TestCase):
+
+    def setUp(self):
+        self.interpreter = Interpreter("games/BRIX", TestController(None),
+                                       InterpreterTests.correct_sprites)
+        self.scheduler = Scheduler(self.interpreter, 20)
+
+    def test_step_back(self):
+        buffer = RewindBuffer(keyframe_interval=4)
+        states = []
+        for _ in range(10):
+            self.scheduler.run_frame()
+            buffer.capture(self.interpreter)
+            states.append(self.interpreter.serialize_state())
+        self.assertEqual(10, len(buffer))
+        self.assertTrue(buffer.step_back(self.interpreter))
+        self.assertEqual(states[-2], self.interpreter.serialize_state())
+        for state in reversed(states[:-2]):
+            self.assertTrue(buffer.step_back(self.interpreter))
+            self.assertEqual(state, self.interpreter.serialize_state())
+        self.assertFalse(buffer.step_back(self.interpreter))
+        self.assertEqual(0, buffer.size)
+
+    def test_interval(self):
+        buffer = RewindBuffer(interval=3)
+        for _ in range(10):
+            buffer.capture(self.interpreter)
+        self.assertEqual(3, len(buffer))
+
+    def test_size_limit(self):
+        buffer = RewindBuffer(size_limit=20000, keyframe_interval=10)
+        for _ in range(200):
+            self.scheduler.run_frame()
+            buffer.capture(self.interpreter)
+        self.assertLessEqual(buffer.size, 20000)
+        self.assertLess(len(buffer), 200)
+        self.assertGreater(len(buffer), 0)
+
+
+class HeadlessRunnerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = HeadlessRunner("games/BRIX",
+                                     InterpreterTests.correct_sprites)
+
+    def test_run(self):
+        result = self.runner.run(95, record_frames=True)
+        self.assertEqual(95, result.instructions)
+        self.assertEqual(10, len(result.frame_hashes))
+        self.assertEqual(state_hash(self.runner.interpreter),
+                         result.state_hash)
+
+    def test_events(self):
+        result = self.runner.run(25, [(0, 3), (12, None), (20, 0xa)])
+        self.assertEqual(25, result.instructions)
+        self.assertEqual(0xa, self.runner.controller.get_key_code())
+
+    def test_same_hash_with_translator(self):
+        translated = HeadlessRunner("games/BRIX",
+                                    InterpreterTests.correct_sprites,
+                                    use_translator=True, seed=2)
+        self.runner.interpreter.random.seed(2)
+        first = self.runner.run(3000, [(0, 4), (1000, None)])
+        second = translated.run(3000, [(0, 4), (1000, None)])
+        self.assertEqual(first.state_hash, second.state_hash)
+
+    def test_reset(self):
+        runner = HeadlessRunner("games/BRIX",
+                                InterpreterTests.correct_sprites, seed=4)
+        runner.run(2000, [(0, 5)])
+        runner.reset("games/PONG")
+        reused = runner.run(2000)
+        fresh = HeadlessRunner("games/PONG",
+                               InterpreterTests.correct_sprites,
+                               seed=4).run(2000)
+        self.assertEqual(fresh.state_hash, reused.state_hash)
+
+    def test_batch(self):
+        jobs = create_jobs(["games/PONG", "games/UFO"], [], 500)
+        report = run_batch(jobs, InterpreterTests.correct_sprites,
+                           processes=2)
+        self.assertEqual(2, report.processes)
+        self.assertEqual(["games/PONG", "games/UFO"],
+                         [result.game_file for result in report.results])
+        self.assertEqual(1000, report.cycles)
+        self.assertEqual(1000, report.to_dict()['cycles'])
+
+    def test_read_input_script(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".txt",
+                                         delete=False) as f:
+            f.write("# key presses\n20 -\n0 f\n\n10 a  # fire\n")
+        self.addCleanup(os.remove, f.name)
+        self.assertEqual([(0, 0xf), (10, 0xa), (20, None)],
+                         read_input_script(f.name))
+
+
+class MovieTests(unittest.TestCase):
+
+    def setUp(self):
+        self.runner = HeadlessRunner("games/BRIX",
+                                     InterpreterTests.correct_sprites,
+                                     seed=9)
+        self.recorder = MovieRecorder(self.runner.interpreter,
+                                      self.runner.scheduler, "games/BRIX",
+                                      keyframe_interval=20)
+
+    def record(self):
+        self.runner.run(300)
+        self.recorder.start()
+        keys = [4, 4, None, 6, 6, 6, None, 4, None, 6]
+        for key in keys * 10:
+            self.runner.controller.set_key_code(key)
+            self.runner.run(10)
+        return self.recorder.stop()
+
+    def test_replay_matches_recording(self):
+        movie = Movie.from_bytes(self.record().to_bytes())
+        self.assertEqual(100, movie.frames)
+        self.assertEqual(1000, movie.cycles)
+        self.assertEqual(6, len(movie.keyframes))
+        self.assertIs(self.runner.controller,
+                      self.runner.interpreter.controller)
+        player = MoviePlayer(movie, "games/BRIX",
+                             InterpreterTests.correct_sprites)
+        player.run_to(movie.frames)
+        self.assertTrue(player.finished)
+        self.assertEqual(movie.state_hash, player.state_hash())
+        self.assertEqual(state_hash(self.runner.interpreter),
+                         player.state_hash())
+
+    def test_seek_matches_full_replay(self):
+        movie = self.record()
+        player = MoviePlayer(movie, "games/BRIX",
+                             InterpreterTests.correct_sprites)
+        player.run_to(57)
+        expected = player.state_hash()
+        seeker = MoviePlayer(movie, "games/BRIX",
+                             InterpreterTests.correct_sprites,
+                             use_translator=True)
+        seeker.seek(90)
+        seeker.seek(57)
+        self.assertEqual(57, seeker.frame)
+        self.assertEqual(expected, seeker.state_hash())
+
+    def test_version_1_movie(self):
+        state = zlib.compress(self.runner.interpreter.serialize_state())
+        data = HEADER.pack(b'CH8M', 1, rom_hash("games/BRIX"), 10, 20) + \
+            b'K' + KEYFRAMES[1].pack(0, 0, 4, len(state)) + state + \
+            b'E' + EVENTS[1].pack(5, 0xff) + \
+            b'Z' + END.pack(1, 10, bytes(20))
+        movie = Movie.from_bytes(data)
+        self.assertEqual(1 << 4, movie.keyframes[0].keys)
+        self.assertEqual([(5, 0)], movie.events)
+        self.assertEqual(2, HEADER.unpack_from(movie.to_bytes())[1])
+
+    def test_wrong_rom(self):
+        movie = self.record()
+        self.assertRaises(Exception, MoviePlayer, movie, "games/PONG",
+                          InterpreterTests.correct_sprites)
+        self.assertRaises(Exception, Movie.from_bytes,
+                          movie.to_bytes()[:-5])
+
+
+class WorkerTests(unittest.TestCase):
+
+    def test_frame_buffer(self):
+        frames = FrameBuffer(4)
+        self.assertIsNone(frames.take())
+        frames.publish(b'\x01\x02\x03\x04', [(0, 1)])
+        frames.publish(b'\x05\x06\x07\x08', [(3, 2)])
+        self.assertEqual((b'\x05\x06\x07\x08', [(0, 1), (3, 2)]),
+                         frames.take())
+        self.assertIsNone(frames.take())
+        frames.publish(b'\x09\x0a\x0b\x0c', [])
+        self.assertEqual((b'\x09\x0a\x0b\x0c', []), frames.take())
+
+    def test_emulation_thread(self):
+        interpreter = Interpreter("games/BRIX", TestController(None),
+                                  InterpreterTests.correct_sprites, seed=0)
+        scheduler = Scheduler(interpreter, 10)
+        published = []
+        worker = EmulationThread(scheduler, lambda: published.append(1))
+        worker.start()
+        self.addCleanup(worker.stop)
+        worker.submit(scheduler.start_turbo, None, 30).result()
+        while worker.submit(lambda: scheduler.turbo).result():
+            pass
+        self.assertGreaterEqual(scheduler.frames, 30)
+        self.assertTrue(published)
+        frame, spans = worker.frames.take()
+        self.assertEqual(interpreter.display.WIDTH *
+                         interpreter.display.HEIGHT // 8, len(frame))
+        self.assertEqual(savestate.SIZE,
+                         len(worker.submit(interpreter.serialize_state)
+                             .result()))
+        failed = worker.submit(interpreter.load_state, b'broken')
+        self.assertRaises(Exception, failed.result)
+        worker.stop()
+        self.assertFalse(worker.is_alive())
+
+    def test_rom_error_stops_thread(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            f.write(bytes.fromhex("0000"))
+        self.addCleanup(os.remove, f.name)
+        interpreter = Interpreter(f.name, TestController(None),
+                                  InterpreterTests.correct_sprites, seed=0)
+        errors = []
+        worker = EmulationThread(Scheduler(interpreter, 10),
+                                 error_callback=errors.append)
+        queued = worker.submit(lambda: 42)
+        worker.start()
+        worker.join(5)
+        self.assertFalse(worker.is_alive())
+        self.assertEqual(42, queued.result(0))
+        self.assertEqual([worker.error], errors)
+        self.assertIn("Wrong command code", str(worker.error))
+        failed = worker.submit(interpreter.serialize_state)
+        self.assertTrue(failed.done())
+        self.assertRaises(Exception, failed.result, 0)
+        worker.stop()
+
+
+class ServerTests(unittest.TestCase):
+
+    def test_encode_frame(self):
+        display = Display()
+        display.draw_sprite(0, 3, [0xf0])
+        self.assertEqual(FRAME_HEADER.size, len(encode_frame(7, display, [])))
+        data = encode_frame(7, display, [3])
+        self.assertEqual(FRAME_HEADER.size + ROW.size, len(data))
+        self.assertEqual((3, b'\xf0' + bytes(7)),
+                         ROW.unpack_from(data, FRAME_HEADER.size))
+
+    def test_spectators(self):
+        server = FrameServer("games/BRIX", InterpreterTests.correct_sprites,
+                             seed=0, port=0)
+
+        async def spectate():
+            await server.start()
+            clients = [FrameClient(), FrameClient()]
+            for client in clients:
+                await client.connect(server.host, server.port)
+                await client.receive()
+                self.assertEqual(server.interpreter.display.to_bytes(),
+                                 client.to_bytes())
+            clients[0].send_key(4)
+            while server.controller.get_key_code() != 4:
+                await asyncio.sleep(0.001)
+            presented = server.scheduler.presented_frames
+            for frame in range(30):
+                server.scheduler.run_frame()
+            for client in clients:
+                for message in range(server.scheduler.presented_frames -
+                                     presented):
+                    await client.receive()
+                self.assertEqual(server.interpreter.display.to_bytes(),
+                                 client.to_bytes())
+            clients[1].send_key(None)
+            while server.controller.get_key_code() is not None:
+                await asyncio.sleep(0.001)
+            for client in clients:
+                await client.close()
+            server.server.close()
+            await server.server.wait_closed()
+
+        asyncio.run(spectate())
+        self.assertGreater(server.scheduler.presented_frames, 0)
+
+
+class CatalogTests(unittest.TestCase):
+
+    def test_analyze(self):
+        program = bytes.fromhex("2206 3000 1200 f015 8016 00ee ffff")
+        handlers, entry_points, invalid, instructions = analyze(program)
+        self.assertEqual([0x200, 0x206], entry_points)
+        self.assertEqual([], invalid)
+        self.assertEqual(6, instructions)
+        self.assertEqual({"speed": 85, "quirks": ["shift"]},
+                         suggest_settings(handlers))
+        handlers, entry_points, invalid, instructions = \
+            analyze(bytes.fromhex("3000 ffff 1200"))
+        self.assertEqual([0x202], invalid)
+        self.assertEqual(80, suggest_settings(handlers)["speed"])
+
+    def test_cache(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        games = os.path.join(directory.name, "games")
+        path = os.path.join(directory.name, "catalog.json")
+        os.mkdir(games)
+        for game in ("PONG", "UFO"):
+            with open(os.path.join("games", game), 'rb') as source, \
+                    open(os.path.join(games, game), 'wb') as f:
+                f.write(source.read())
+        catalog = Catalog(games, path)
+        catalog.load()
+        self.assertEqual(["PONG", "UFO"],
+                         [rom.name for rom in catalog.update()])
+        self.assertEqual(2, catalog.scanned)
+        cached = Catalog(games, path)
+        cached.load()
+        cached.update()
+        self.assertEqual(0, cached.scanned)
+        self.assertEqual(catalog.get("UFO").to_dict(),
+                         cached.get("UFO").to_dict())
+        self.assertEqual("UFO", cached.find(catalog.get("UFO").sha1).name)
+        with open(os.path.join(games, "UFO"), 'ab') as f:
+            f.write(b'\x00\xe0')
+        os.remove(os.path.join(games, "PONG"))
+        cached.update()
+        self.assertEqual(1, cached.scanned)
+        self.assertIsNone(cached.get("PONG"))
+        self.assertNotEqual(catalog.get("UFO").sha1, cached.get("UFO").sha1)
+        with open(path, 'w') as f:
+            f.write("{broken")
+        broken = Catalog(games, path)
+        broken.load()
+        broken.update()
+        self.assertEqual(1, broken.scanned)
+
+
+class BenchmarkTests(unittest.TestCase):
+
+    def test_compare(self):
+        baseline = {"rom/UFO": {"value": 1000, "unit": "instructions/sec"},
+                    "micro/draw": {"value": 10, "unit": "us/op"}}
+        results = [bench.Result("rom/UFO", 850, "instructions/sec"),
+                   bench.Result("micro/draw", 11, "us/op"),
+                   bench.Result("micro/memory", 99, "us/op")]
+        self.assertEqual([], bench.compare(results, baseline, 0.2))
+        results[0].value = 700
+        results[1].value = 13
+        self.assertEqual(["rom/UFO", "micro/draw"],
+                         [result.name for result
+                          in bench.compare(results, baseline, 0.2)])
+        results[1].spread = 0.35
+        self.assertEqual(["rom/UFO"],
+                         [result.name for result
+                          in bench.compare(results, baseline, 0.2)])
+        results[0].params = {"cycles": 20000}
+        self.assertEqual([], bench.compare(results, baseline, 0.2))
+
+    def test_noise_allowance_is_capped(self):
+        baseline = {"micro/serialize_state": {"value": 8, "unit": "us/op",
+                                              "spread": 0.9}}
+        slower = bench.Result("micro/serialize_state", 11.2, "us/op",
+                              spread=0.9)
+        self.assertEqual([slower], bench.compare([slower], baseline))
+        slower.spread = 0.01
+        self.assertEqual([slower], bench.compare([slower], baseline))
+
+    def test_slower_than_plain(self):
+        results = [bench.Result("rom/UFO", 1000, "instructions/sec"),
+                   bench.Result("rom/UFO/translated", 950,
+                                "instructions/sec"),
+                   bench.Result("rom/PONG", 1000, "instructions/sec"),
+                   bench.Result("rom/PONG/translated", 600,
+                                "instructions/sec")]
+        self.assertEqual([results[3]], bench.slower_than_plain(results))
+        results[3].params = {"cycles": 20000}
+        self.assertEqual([], bench.slower_than_plain(results))
+
+    def test_spread_ignores_outliers(self):
+        self.assertAlmostEqual(0.01, bench.spread([99, 100, 101, 100, 40],
+                                                  100))
+
+    def test_baseline_keeps_parameters(self):
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            pass
+        self.addCleanup(os.remove, f.name)
+        params = bench.run_parameters(20000, 10)
+        bench.save_baseline(f.name, {}, [bench.Result(
+            "rom/UFO", 1000, "instructions/sec", params, 0.1)])
+        baseline = bench.load_baseline(f.name)
+        self.assertEqual(params, baseline["rom/UFO"]["params"])
+        slower = bench.Result("rom/UFO", 600, "instructions/sec",
+                              bench.run_parameters(100000, 10))
+        self.assertEqual([], bench.compare([slower], baseline))
+        slower.params = params
+        self.assertEqual([slower], bench.compare([slower], baseline))
+
+    def test_rom_benchmarks(self):
+        results = bench.rom_benchmarks(InterpreterTests.correct_sprites,
+                                       100, ["PONG"])
+        self.assertEqual(["rom/PONG", "rom/PONG/translated"],
+                         [result.name for result in results])
+        self.assertTrue(all(result.value > 0 for result in results))
+
 
 if __name__ == "__main__":
     unittest.main()
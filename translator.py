@@ -0,0 +1,301 @@
+#!/usr/bin/python3
+
+import opcodes
+
+
+class Block:
+
+    def __init__(self, start, end, function, code=b""):
+        self.start = start
+        self.end = end
+        self.function = function
+        self.code = code
+
+    @property
+    def length(self):
+        return (self.end - self.start) // 2
+
+
+class BlockTranslator:
+
+    MAX_BLOCK_LENGTH = 16
+    HOT_THRESHOLD = 64
+
+    def __init__(self, interpreter):
+        self.interpreter = interpreter
+        self._blocks = {}
+        self._retired = {}
+        self._visits = {}
+        self._covering = [[] for _ in range(4096)]
+        interpreter.code_write_listeners.append(self.invalidate)
+
+    def invalidate(self, address, length=1):
+        start = max(address - 1, 0)
+        end = min(address + length, 4096)
+        for covered in range(start, end):
+            for block_start in list(self._covering[covered]):
+                block = self._blocks.pop(block_start, None)
+                if block is not None:
+                    self._forget(block)
+                    self._retired[block_start] = block
+
+    def _forget(self, block):
+        for address in range(block.start, block.end):
+            if address < 4096:
+                self._covering[address].remove(block.start)
+
+    def get_block(self, address):
+        block = self._blocks.get(address)
+        if block is None:
+            block = self._retired.pop(address, None)
+            if block is None or block.code != self._code(block.start,
+                                                         block.end):
+                block = self.translate(address)
+            self._blocks[address] = block
+            for covered in range(block.start, block.end):
+                if covered < 4096:
+                    self._covering[covered].append(address)
+        return block
+
+    def _code(self, start, end):
+        return bytes(self.interpreter.memory.view(start, end - start))
+
+    def run(self, cycles):
+        interpreter = self.interpreter
+        registers = interpreter.registers
+        execute_next_command = interpreter.execute_next_command
+        blocks = self._blocks
+        visits = self._visits
+        executed = 0
+        length = 1
+        following = -1
+        interpreter.skip_idle_loops = True
+        try:
+            while executed < cycles:
+                address = interpreter.instruction_pointer
+                block = None
+                if address != following:
+                    block = blocks.get(address)
+                    if block is None:
+                        count = visits.get(address, 0) + 1
+                        visits[address] = count
+                        if count >= self.HOT_THRESHOLD:
+                            block = self.get_block(address)
+                if block is None:
+                    length = 0
+                    budget = cycles - executed
+                    following = address
+                    while length < budget and \
+                            interpreter.instruction_pointer == following:
+                        length += 1
+                        following += 2
+                        execute_next_command()
+                elif block.function is None:
+                    length = 1
+                    following = -1
+                    execute_next_command()
+                else:
+                    length = block.function(interpreter, registers,
+                                            cycles - executed)
+                    following = -1
+                executed += length
+        except opcodes.IdleLoop as loop:
+            interpreter.skip_idle_loops = False
+            interpreter.finish_idle_loop(loop.length,
+                                         cycles - executed - length)
+            executed = cycles
+        finally:
+            interpreter.skip_idle_loops = False
+        return executed
+
+    def translate(self, start):
+        generator = _BlockGenerator(self.interpreter, start)
+        address = start
+        while address < 4095 and not generator.finished and \
+                (address - start) // 2 < self.MAX_BLOCK_LENGTH:
+            consumed = generator.add(address)
+            if not consumed:
+                break
+            address += consumed
+        if address == start:
+            return Block(start, start + 2, None, self._code(start, start + 2))
+        return Block(start, address, generator.compile(address),
+                     self._code(start, address))
+
+
+class _BlockGenerator:
+
+    ARITHMETIC = {0: "V[{x}] = V[{y}]",
+                  1: "V[{x}] |= V[{y}]",
+                  2: "V[{x}] &= V[{y}]",
+                  3: "V[{x}] ^= V[{y}]",
+                  4: "t = V[{y}]; V[15] = V[{x}] + t > 0xff; "
+                     "V[{x}] = (V[{x}] + t) & 0xff",
+                  5: "t = V[{y}]; V[15] = V[{x}] > t; "
+                     "V[{x}] = (V[{x}] - t) & 0xff",
+                  6: "V[15] = V[{x}] & 1; V[{x}] >>= 1",
+                  7: "t = V[{y}]; V[15] = t > V[{x}]; "
+                     "V[{x}] = (t - V[{x}]) & 0xff",
+                  0xe: "V[15] = V[{x}] >> 7; V[{x}] = (V[{x}] << 1) & 0xff"}
+
+    SKIPS = {0x3: "V[{x}] == {kk}",
+             0x4: "V[{x}] != {kk}",
+             0x5: "V[{x}] == V[{y}]",
+             0x9: "V[{x}] != V[{y}]",
+             0x9e: "interp.controller.is_pressed(V[{x}])",
+             0xa1: "not interp.controller.is_pressed(V[{x}])"}
+
+    MEMORY_WRITES = {0x33: "store_decimal_to_memory",
+                     0x55: "store_registers"}
+
+    def __init__(self, interpreter, start):
+        self.interpreter = interpreter
+        self.start = start
+        self.finished = False
+        self._lines = []
+        self._count = 0
+        self._loops = False
+
+    def _emit(self, line, indent=""):
+        self._lines.append(indent + line)
+
+    def _code_at(self, address):
+        memory = self.interpreter.memory
+        return memory.get_value(address) << 8 | memory.get_value(address + 1)
+
+    def _executed(self, extra=0):
+        count = self._count + extra
+        return "n + {0}".format(count) if count else "n"
+
+    def _exit(self, target, indent, extra=0):
+        self._emit("interp.instruction_pointer = {0}".format(target), indent)
+        self._emit("return " + self._executed(extra), indent)
+
+    def _check_budget(self, address, indent=""):
+        self._emit("if {0} >= budget:".format(self._executed()), indent)
+        self._exit(address, indent + "    ")
+
+    def _decode(self, address, code):
+        command_number = (code & 0xf000) >> 12
+        x = (code & 0x0f00) >> 8
+        y = (code & 0x00f0) >> 4
+        n = code & 0x000f
+        kk = code & 0x00ff
+        nnn = code & 0x0fff
+        next_address = address + 2
+
+        if code == 0x00e0:
+            return 'plain', ["interp.display.clear()"]
+        elif code == 0x00ee:
+            return 'jump', [], "interp.stack.pop()"
+        elif command_number == 0x1 and \
+                not opcodes.may_be_idle_jump(address, nnn):
+            return 'jump', [], nnn
+        elif command_number == 0x2:
+            return 'jump', ["interp.stack.push({0})".format(next_address)], \
+                nnn
+        elif command_number in (0x3, 0x4) or \
+                command_number in (0x5, 0x9) and n == 0:
+            condition = self.SKIPS[command_number]
+            return 'skip', condition.format(x=x, y=y, kk=kk)
+        elif command_number == 0x6:
+            return 'plain', ["V[{0}] = {1}".format(x, kk)]
+        elif command_number == 0x7:
+            return 'plain', ["V[{0}] = (V[{0}] + {1}) & 0xff".format(x, kk)]
+        elif command_number == 0x8 and n in self.ARITHMETIC:
+            return 'plain', [self.ARITHMETIC[n].format(x=x, y=y)]
+        elif command_number == 0xa:
+            return 'plain', ["interp.index = {0}".format(nnn)]
+        elif command_number == 0xb:
+            return 'jump', [], "{0} + V[0]".format(nnn)
+        elif command_number == 0xc:
+            return 'plain', ["V[{0}] = interp.random.next_byte() & {1}"
+                             .format(x, kk)]
+        elif command_number == 0xd:
+            return 'plain', ["opcodes.draw_sprite(interp, V[{0}], V[{1}], "
+                             "{2})".format(x, y, n)]
+        elif command_number == 0xe and kk in (0x9e, 0xa1):
+            return 'skip', self.SKIPS[kk].format(x=x)
+        elif command_number == 0xf and kk == 0x07:
+            return 'plain', ["V[{0}] = interp.delay_timer.ticks".format(x)]
+        elif command_number == 0xf and kk in (0x15, 0x18):
+            timer = "delay_timer" if kk == 0x15 else "sound_timer"
+            return 'plain', ["interp.{0}.ticks = V[{1}]".format(timer, x)]
+        elif command_number == 0xf and kk == 0x1e:
+            return 'plain', ["interp.index = (interp.index + V[{0}]) & "
+                             "0xffff".format(x)]
+        elif command_number == 0xf and kk == 0x29:
+            return 'plain', ["interp.index = V[{0}] * 5".format(x)]
+        elif command_number == 0xf and kk in self.MEMORY_WRITES:
+            return 'write', ["opcodes.{0}(interp, {1}, 0, 0)"
+                             .format(self.MEMORY_WRITES[kk], x)]
+        elif command_number == 0xf and kk == 0x65:
+            return 'plain', ["opcodes.load_registers(interp, {0}, 0, 0)"
+                             .format(x)]
+        return None
+
+    def _instruction(self, address, instruction, indent=""):
+        kind, lines = instruction[:2]
+        if kind == 'write':
+            self._emit("interp.instruction_pointer = {0}".format(
+                address + 2), indent)
+            for line in lines:
+                self._emit(line, indent)
+            self._emit("return " + self._executed(1), indent)
+            return True
+        for line in lines:
+            self._emit(line, indent)
+        if kind == 'jump' and instruction[2] == self.start:
+            self._emit("n += {0}".format(self._count + 1), indent)
+            self._emit("if n >= budget:", indent)
+            self._emit("interp.instruction_pointer = {0}".format(self.start),
+                       indent + "    ")
+            self._emit("return n", indent + "    ")
+            self._emit("continue", indent)
+            self._loops = True
+            return True
+        if kind == 'jump':
+            self._exit(instruction[2], indent, 1)
+            return True
+        return False
+
+    def add(self, address):
+        instruction = self._decode(address, self._code_at(address))
+        if instruction is None:
+            return 0
+        if address != self.start:
+            self._check_budget(address)
+        if instruction[0] != 'skip':
+            self.finished = self._instruction(address, instruction)
+            self._count += 1
+            return 2
+        condition = instruction[1]
+        skipped = address + 2
+        self._count += 1
+        following = None
+        if skipped < 4095:
+            following = self._decode(skipped, self._code_at(skipped))
+        if following is None or following[0] == 'skip':
+            self._exit("{0} if {1} else {2}".format(skipped + 2, condition,
+                                                    skipped), "")
+            self.finished = True
+            return 2
+        self._emit("if not ({0}):".format(condition))
+        self._check_budget(skipped, "    ")
+        if not self._instruction(skipped, following, "    "):
+            self._emit("n += 1", "    ")
+        return 4
+
+    def compile(self, end):
+        if not self.finished:
+            self._exit(end, "")
+        indent = "    "
+        source = "def block(interp, V, budget):\n    n = 0\n"
+        if self._loops:
+            source += "    while True:\n"
+            indent += "    "
+        source += "".join(indent + line + "\n" for line in self._lines)
+        namespace = {'opcodes': opcodes}
+        exec(compile(source, "<block {0:#05x}>".format(self.start), "exec"),
+             namespace)
+        return namespace['block']
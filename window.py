@@ -0,0 +1,377 @@
+#!/usr/bin/python3
+
+from interpreter import Interpreter, load_sprites
+from controller import Controller
+from scheduler import Scheduler, instructions_per_frame_for_speed
+from rewind import RewindBuffer
+from movie import MovieRecorder
+from worker import EmulationThread
+from catalog import Catalog
+import sys
+from PyQt5 import QtCore, QtGui, QtWidgets, QtMultimedia
+import datetime
+import re
+import os
+
+
+TURBO_SPEEDS = {"Uncapped": None, "2x": 2, "4x": 4, "8x": 8}
+
+KEYPAD = {QtCore.Qt.Key_0: 0x0, QtCore.Qt.Key_1: 0x1,
+          QtCore.Qt.Key_2: 0x2, QtCore.Qt.Key_3: 0x3,
+          QtCore.Qt.Key_Q: 0x4, QtCore.Qt.Key_W: 0x5,
+          QtCore.Qt.Key_E: 0x6, QtCore.Qt.Key_R: 0x7,
+          QtCore.Qt.Key_A: 0x8, QtCore.Qt.Key_S: 0x9,
+          QtCore.Qt.Key_D: 0xa, QtCore.Qt.Key_F: 0xb,
+          QtCore.Qt.Key_Z: 0xc, QtCore.Qt.Key_X: 0xd,
+          QtCore.Qt.Key_C: 0xe, QtCore.Qt.Key_V: 0xf}
+
+PALETTES = {"Classic": ("black", "white"),
+            "Amber": ("#1a0f00", "#ffb000"),
+            "Green": ("#001a00", "#33ff33"),
+            "Paper": ("white", "black")}
+
+
+class MainWindow(QtWidgets.QWidget):
+
+    frame_ready = QtCore.pyqtSignal()
+    beep = QtCore.pyqtSignal()
+    emulation_failed = QtCore.pyqtSignal(str)
+
+    def __init__(self, game, speed, sprites, state=None, scale=10,
+                 palette=PALETTES["Classic"], rewind_size=4 * 1024 * 1024,
+                 rewind_interval=1, turbo_multiplier=None):
+        super().__init__()
+        self.game = game
+        self.turbo_multiplier = turbo_multiplier
+        self.path = os.path.join("games", game)
+        self.sound = QtMultimedia.QSound('beep.wav')
+        self.beep.connect(self.sound.play)
+        self.controller = Controller()
+
+        self.interpreter = Interpreter(self.path, self.controller, sprites,
+                                       self.beep.emit)
+        if state is not None:
+            self.interpreter.load_state(state)
+
+        self.display = Display(self, palette)
+        self.display.move(0, 0)
+        self.resize(self.interpreter.display.WIDTH * scale,
+                    self.interpreter.display.HEIGHT * scale)
+        self.show()
+
+        self.scheduler = Scheduler(self.interpreter,
+                                   instructions_per_frame_for_speed(speed))
+        self.rewind = RewindBuffer(rewind_size, rewind_interval)
+        self.scheduler.frame_listeners.append(
+            lambda: self.rewind.capture(self.interpreter))
+        self.recorder = MovieRecorder(self.interpreter, self.scheduler,
+                                      self.path)
+        self.profiler_view = None
+        self.worker = EmulationThread(
+            self.scheduler, self.frame_ready.emit,
+            lambda error: self.emulation_failed.emit(str(error)))
+        self.frame_ready.connect(self.present_frame)
+        self.emulation_failed.connect(
+            lambda error: self.show_error("emulation stopped: " + error))
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.update_title)
+        self.timer.start(1000)
+        self.worker.start()
+
+    def resizeEvent(self, event):
+        self.display.resize(event.size())
+
+    def closeEvent(self, event):
+        self.timer.stop()
+        self.worker.stop()
+        super().closeEvent(event)
+
+    def present_frame(self):
+        frame = self.worker.frames.take()
+        if frame is not None:
+            self.display.present(*frame)
+
+    def show_error(self, message):
+        self.update_title()
+        QtWidgets.QMessageBox.critical(self, self.game, message)
+
+    def _call_worker(self, function, *args):
+        try:
+            return self.worker.submit(function, *args).result()
+        except Exception as e:
+            self.show_error(str(e))
+            return None
+
+    def update_title(self):
+        if self.worker.error is not None:
+            self.setWindowTitle("{0} - stopped: {1}".format(
+                self.game, self.worker.error))
+            return
+        self.setWindowTitle("{0} - {1} presented, {2} skipped{3}".format(
+            self.game, self.scheduler.presented_frames,
+            self.scheduler.skipped_frames,
+            " - fast-forward" if self.scheduler.turbo else ""))
+
+    def fast_forward(self, multiplier=None, frames=None):
+        return self.worker.submit(self.scheduler.start_turbo, multiplier,
+                                  frames)
+
+    def stop_fast_forward(self):
+        return self.worker.submit(self._stop_turbo)
+
+    def _stop_turbo(self):
+        if self.scheduler.turbo:
+            self.scheduler.stop_turbo()
+
+    def keyPressEvent(self, event):
+        if event.key() == QtCore.Qt.Key_F4:
+            self.save_game()
+        elif event.key() == QtCore.Qt.Key_F5:
+            self.toggle_recording()
+        elif event.key() == QtCore.Qt.Key_F6:
+            self.toggle_profiling()
+        elif event.key() == QtCore.Qt.Key_Tab:
+            if not event.isAutoRepeat():
+                self.fast_forward(self.turbo_multiplier)
+        elif event.key() == QtCore.Qt.Key_Backspace:
+            self.worker.submit(self._step_back)
+        elif event.key() in KEYPAD and not event.isAutoRepeat():
+            self.controller.press(KEYPAD[event.key()])
+
+    def focusNextPrevChild(self, next):
+        return False
+
+    def keyReleaseEvent(self, event):
+        if event.key() == QtCore.Qt.Key_Tab:
+            if not event.isAutoRepeat():
+                self.stop_fast_forward()
+        elif event.key() in KEYPAD and not event.isAutoRepeat():
+            self.controller.release(KEYPAD[event.key()])
+
+    def _step_back(self):
+        if not self.recorder.recording:
+            self.rewind.step_back(self.interpreter)
+
+    def _toggle_recording(self):
+        if not self.recorder.recording:
+            self.recorder.start()
+            return None
+        return self.recorder.stop()
+
+    def toggle_recording(self):
+        movie = self._call_worker(self._toggle_recording)
+        if movie is None:
+            return
+        os.makedirs("movies", exist_ok=True)
+        movie.save(os.path.join("movies", self.game + "#" +
+                                datetime.datetime.now()
+                                .strftime('%Y-%m-%d %H:%M:%S') + ".ch8m"))
+
+    def toggle_profiling(self):
+        if self.profiler_view is None:
+            profiler = self._call_worker(self.scheduler.start_profiling)
+            if profiler is None:
+                return
+            self.profiler_view = ProfilerView(profiler, self.game)
+            return
+        profiler = self._call_worker(self.scheduler.stop_profiling)
+        self.profiler_view.close()
+        self.profiler_view = None
+        if profiler is None:
+            return
+        os.makedirs("profiles", exist_ok=True)
+        profiler.dump(os.path.join("profiles", self.game + "#" +
+                                   datetime.datetime.now()
+                                   .strftime('%Y-%m-%d %H:%M:%S') + ".json"))
+
+    def save_game(self):
+        interpreter_state = self._call_worker(
+            self.interpreter.serialize_state)
+        if interpreter_state is None:
+            return
+        path = os.path.join("saves", self.game + "#" +
+                            datetime.datetime.now()
+                            .strftime('%Y-%m-%d %H:%M:%S'))
+        with open(path, "wb") as f:
+            f.write(self.game.encode())
+            f.write(b'\n')
+            f.write(interpreter_state)
+
+
+class ProfilerView(QtWidgets.QPlainTextEdit):
+
+    REFRESH_INTERVAL = 500
+
+    def __init__(self, profiler, game):
+        super().__init__()
+        self.profiler = profiler
+        self.setReadOnly(True)
+        self.setWindowTitle(game + " - profiler")
+        font = QtGui.QFontDatabase.systemFont(QtGui.QFontDatabase.FixedFont)
+        self.setFont(font)
+        self.resize(480, 640)
+        self.timer = QtCore.QTimer(self)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(self.REFRESH_INTERVAL)
+        self.refresh()
+        self.show()
+
+    def refresh(self):
+        self.setPlainText(self.profiler.format())
+
+
+class Display(QtWidgets.QFrame):
+
+    def __init__(self, parent, palette):
+        super().__init__(parent)
+        self.interpreter = parent.interpreter
+        background, foreground = palette
+        self._color_table = [QtGui.QColor(background).rgb(),
+                             QtGui.QColor(foreground).rgb()]
+        self._frame = self.interpreter.display.to_bytes()
+        self._pixmap = None
+
+    def _row_top(self, row):
+        return row * self.height() // self.interpreter.display.HEIGHT
+
+    def present(self, frame, spans):
+        self._frame = frame
+        if spans:
+            self._pixmap = None
+        for first_row, rows in spans:
+            top = self._row_top(first_row)
+            bottom = self._row_top(first_row + rows) + 1
+            self.update(0, top, self.width(), bottom - top)
+
+    def _render(self):
+        display = self.interpreter.display
+        image = QtGui.QImage(self._frame, display.WIDTH, display.HEIGHT,
+                             display.WIDTH // 8, QtGui.QImage.Format_Mono)
+        image.setColorTable(self._color_table)
+        return QtGui.QPixmap.fromImage(
+            image.scaled(self.size(), QtCore.Qt.IgnoreAspectRatio,
+                         QtCore.Qt.FastTransformation))
+
+    def resizeEvent(self, event):
+        self._pixmap = None
+
+    def paintEvent(self, event):
+        if self._pixmap is None:
+            self._pixmap = self._render()
+        painter = QtGui.QPainter(self)
+        painter.drawPixmap(event.rect(), self._pixmap, event.rect())
+
+
+class StartWindow(QtWidgets.QWidget):
+
+    def __init__(self):
+        super().__init__()
+        self.move(100, 100)
+
+        vbox_layout = QtWidgets.QVBoxLayout()
+
+        start_button = QtWidgets.QPushButton(self)
+        start_button.setText("Start")
+        start_button.clicked.connect(self.start_game)
+        vbox_layout.addWidget(start_button)
+
+        change_speed_label = QtWidgets.QLabel("Speed", self)
+        vbox_layout.addWidget(change_speed_label)
+
+        self.sld = QtWidgets.QSlider(QtCore.Qt.Horizontal, self)
+        self.sld.setSliderPosition(85)
+        vbox_layout.addWidget(self.sld)
+
+        self.catalog = Catalog()
+        self.catalog.load()
+        self.games = QtWidgets.QComboBox()
+        for rom in self.catalog.update():
+            self.games.addItem(rom.name)
+            self.games.setItemData(self.games.count() - 1, rom.describe(),
+                                   QtCore.Qt.ToolTipRole)
+        self.games.currentTextChanged.connect(self.apply_suggested_settings)
+        vbox_layout.addWidget(self.games)
+
+        sprites_label = QtWidgets.QLabel("Sprites:", self)
+        vbox_layout.addWidget(sprites_label)
+
+        self.sprites = QtWidgets.QComboBox()
+        sprite_list = [sprite for sprite in os.listdir("sprites")]
+        self.sprites.addItems(sprite_list)
+        vbox_layout.addWidget(self.sprites)
+
+        scale_label = QtWidgets.QLabel("Scale:", self)
+        vbox_layout.addWidget(scale_label)
+
+        self.scale = QtWidgets.QSpinBox(self)
+        self.scale.setRange(1, 30)
+        self.scale.setValue(10)
+        vbox_layout.addWidget(self.scale)
+
+        palette_label = QtWidgets.QLabel("Palette:", self)
+        vbox_layout.addWidget(palette_label)
+
+        self.palettes = QtWidgets.QComboBox()
+        self.palettes.addItems(list(PALETTES))
+        vbox_layout.addWidget(self.palettes)
+
+        turbo_label = QtWidgets.QLabel("Fast-forward (Tab):", self)
+        vbox_layout.addWidget(turbo_label)
+
+        self.turbo_speeds = QtWidgets.QComboBox()
+        self.turbo_speeds.addItems(list(TURBO_SPEEDS))
+        vbox_layout.addWidget(self.turbo_speeds)
+
+        load_button = QtWidgets.QPushButton(self)
+        load_button.setText("Load game")
+        load_button.clicked.connect(self.load_game)
+        vbox_layout.addWidget(load_button)
+
+        vbox_layout.addStretch(1)
+        self.setLayout(vbox_layout)
+        self.apply_suggested_settings(self.games.currentText())
+        self.show()
+
+    def apply_suggested_settings(self, game):
+        rom = self.catalog.get(game)
+        if rom is not None:
+            self.sld.setSliderPosition(rom.settings["speed"])
+
+    def start_game(self, *args, **kwargs):
+        sprites = self.load_sprites()
+        game = self.games.currentText()
+        speed = self.sld.value()
+        self.window = MainWindow(game, speed, sprites, None,
+                                 *self.display_settings(),
+                                 turbo_multiplier=self.turbo_multiplier())
+
+    def display_settings(self):
+        return self.scale.value(), PALETTES[self.palettes.currentText()]
+
+    def turbo_multiplier(self):
+        return TURBO_SPEEDS[self.turbo_speeds.currentText()]
+
+    def load_sprites(self):
+        return load_sprites(os.path.join("sprites",
+                                         self.sprites.currentText()))
+
+    def load_game(self):
+        file = QtWidgets.QFileDialog.getOpenFileName(self, "load save",
+                                                     "saves")[0]
+        if file != '':
+            with open(file, "rb") as f:
+                data = f.read()
+                match = re.match(rb"(.*?)\n", data)
+                game = match.group(1).decode()
+                speed = self.sld.value()
+                sprites = self.load_sprites()
+                state = data[match.end():]
+                self.window = MainWindow(
+                    game, speed, sprites, state, *self.display_settings(),
+                    turbo_multiplier=self.turbo_multiplier())
+
+
+def main():
+    app = QtWidgets.QApplication(sys.argv)
+    window = StartWindow()
+    return app.exec_()
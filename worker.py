@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+import concurrent.futures
+import queue
+import threading
+
+from display import dirty_row_spans
+import timer
+
+
+class FrameBuffer:
+
+    def __init__(self, size):
+        self._buffers = [bytearray(size), bytearray(size)]
+        self._back = 0
+        self._dirty_rows = 0
+        self._fresh = False
+        self._lock = threading.Lock()
+
+    def publish(self, frame, spans):
+        self._buffers[self._back][:] = frame
+        dirty_rows = 0
+        for first_row, rows in spans:
+            dirty_rows |= ((1 << rows) - 1) << first_row
+        with self._lock:
+            self._back ^= 1
+            self._dirty_rows |= dirty_rows
+            self._fresh = True
+
+    def take(self):
+        with self._lock:
+            if not self._fresh:
+                return None
+            frame = bytes(self._buffers[self._back ^ 1])
+            dirty_rows = self._dirty_rows
+            self._dirty_rows = 0
+            self._fresh = False
+        return frame, dirty_row_spans(dirty_rows)
+
+
+class EmulationThread(threading.Thread):
+
+    def __init__(self, scheduler, frame_callback=timer.empty_func,
+                 error_callback=timer.empty_func):
+        super().__init__(daemon=True)
+        self.scheduler = scheduler
+        self.interpreter = scheduler.interpreter
+        display = self.interpreter.display
+        self.frames = FrameBuffer(display.WIDTH * display.HEIGHT // 8)
+        self.frame_callback = frame_callback
+        self.error_callback = error_callback
+        self.error = None
+        self._commands = queue.Queue()
+        self._stopping = False
+        self._finished = False
+        self._lock = threading.Lock()
+        scheduler.present_func = self.publish
+
+    def publish(self):
+        display = self.interpreter.display
+        self.frames.publish(display.to_bytes(), display.take_dirty_rows())
+        self.frame_callback()
+
+    def submit(self, function, *args):
+        future = concurrent.futures.Future()
+        with self._lock:
+            if self._finished:
+                future.set_exception(self._stopped_error())
+            else:
+                self._commands.put((future, function, args))
+        return future
+
+    def _stopped_error(self):
+        if self.error is not None:
+            return Exception("emulation stopped: " + str(self.error))
+        return Exception("emulation is not running")
+
+    def stop(self):
+        self._stopping = True
+        self._commands.put(None)
+        if self.is_alive():
+            self.join()
+
+    def _next_command(self, timeout):
+        try:
+            if timeout > 0:
+                return self._commands.get(timeout=timeout)
+            return self._commands.get_nowait()
+        except queue.Empty:
+            return None
+
+    def _run_commands(self, timeout):
+        command = self._next_command(timeout)
+        while command is not None:
+            future, function, args = command
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            command = self._next_command(0)
+
+    def _fail_commands(self):
+        error = self._stopped_error()
+        while True:
+            try:
+                command = self._commands.get_nowait()
+            except queue.Empty:
+                return
+            if command is not None and \
+                    command[0].set_running_or_notify_cancel():
+                command[0].set_exception(error)
+
+    def run(self):
+        try:
+            while not self._stopping:
+                self._run_commands(self.scheduler.time_until_next_frame())
+                if not self._stopping:
+                    self.scheduler.run_due_frames()
+        except Exception as e:
+            self.error = e
+        finally:
+            with self._lock:
+                self._finished = True
+            self._fail_commands()
+        if self.error is not None:
+            self.error_callback(self.error)